@@ -1,32 +1,483 @@
 from __future__ import annotations
 
 from pathlib import Path
-from datetime import datetime
-from io import BytesIO
+from datetime import date, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from typing import Any, Callable, Collection, Dict, List, Optional, Tuple, TypeVar
+import hashlib
+import shutil
+import tempfile
+import threading
+import time
 import zipfile
 
-from desktop_exporter.api import AjaxAPI
+from desktop_exporter.api import AjaxAPI, DownloadInfo, PartialDownload, ProgressCallback
+from desktop_exporter.cache import DayCache
+from desktop_exporter.config import load_config, load_profiles
+from desktop_exporter.credentials import load_tokens
+from desktop_exporter.dbfio import concat_tables
+from desktop_exporter.extract import extract_zip, publish, staging_dir
+from desktop_exporter.jobs import ExportCancelled
+from desktop_exporter.local_export import DEFAULT_LAYOUT, write_facturas
+from desktop_exporter.merge import merge_into
+from desktop_exporter.metrics import ExportMetrics
+from desktop_exporter.optimize import DEFAULT_OPTIMIZE, optimize_tables
+from desktop_exporter.snapshot import Snapshot
 
 
-def run_export(base_url: str, token: str, desde_iso: str, hasta_iso: str, target_dir: str) -> str:
-    api = AjaxAPI(base_url=base_url, token=token)
-    blob = api.download_dbf_zip(fecha_desde=desde_iso, fecha_hasta=hasta_iso)
+# Window sizes accepted for chunked exports
+WINDOWS = ("day", "week", "month")
+DEFAULT_CHUNK_WORKERS = 4
+DEFAULT_PROFILE_WORKERS = 4
+
+T = TypeVar("T")
+
+
+def split_range(desde: date, hasta: date, window: str) -> List[Tuple[date, date]]:
+    """
+    Split the inclusive range [desde, hasta] into consecutive sub-ranges aligned to
+    calendar days, ISO weeks (Monday to Sunday) or calendar months.
+    """
+    if window not in WINDOWS:
+        raise ValueError(f"Ventana desconocida: {window!r}")
+    if hasta < desde:
+        raise ValueError("La fecha 'Hasta' es anterior a 'Desde'")
+    chunks: List[Tuple[date, date]] = []
+    start = desde
+    while start <= hasta:
+        if window == "day":
+            end = start
+        elif window == "week":
+            end = start + timedelta(days=6 - start.weekday())
+        else:
+            next_month = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+            end = next_month - timedelta(days=1)
+        end = min(end, hasta)
+        chunks.append((start, end))
+        start = end + timedelta(days=1)
+    return chunks
+
+
+def _download_and_extract(
+    api: AjaxAPI,
+    desde_iso: str,
+    hasta_iso: str,
+    target: Path,
+    on_progress: ProgressCallback | None = None,
+    extra_headers: Dict[str, str] | None = None,
+) -> Tuple[DownloadInfo, str]:
+    """Fetch one ZIP and unpack it into `target`. Returns the download info and the ZIP's SHA-256."""
+    partial = PartialDownload(
+        f"{api.base_url}/integraciones/api/export_dbf",
+        {"fecha_desde": desde_iso, "fecha_hasta": hasta_iso},
+    )
+    try:
+        # Interrupted transfers keep their spool file so the next attempt resumes it
+        info = api.download_dbf_zip_resumable(
+            fecha_desde=desde_iso,
+            fecha_hasta=hasta_iso,
+            partial=partial,
+            on_progress=on_progress,
+            extra_headers=extra_headers,
+        )
+        if info.not_modified:
+            return info, ""
+        digest = hashlib.sha256()
+        with api.metrics.phase("hash"), partial.path.open("rb") as fh:
+            for block in iter(lambda: fh.read(1024 * 1024), b""):
+                digest.update(block)
+        # Unchanged members are skipped; the rest are swapped in atomically
+        with api.metrics.phase("extract"), zipfile.ZipFile(partial.path) as zf:
+            written, skipped = extract_zip(zf, target)
+        api.metrics.count("files_written", len(written))
+        api.metrics.count("files_skipped", len(skipped))
+        partial.discard()
+    finally:
+        partial.release()
+    return info, digest.hexdigest()
+
+
+def run_export(
+    base_url: str,
+    token: str,
+    desde_iso: str,
+    hasta_iso: str,
+    target_dir: str,
+    on_progress: ProgressCallback | None = None,
+    window: str | None = None,
+    max_workers: int = DEFAULT_CHUNK_WORKERS,
+    incremental: bool = False,
+    local: bool = False,
+    optimize: bool | None = None,
+    merge: bool = False,
+    snapshot: bool = False,
+    offline: bool = False,
+) -> str:
+    """
+    Download the DBF ZIP for the range and extract it into `target_dir`.
+    With `window` set ("day", "week" or "month") the range is fetched as several
+    smaller exports in parallel and the tables are merged locally. With `incremental`
+    only days missing from the local cache (or still open) are fetched. With `local`
+    the DBFs are built on this machine from the facturas JSON instead of export_dbf.
+    `optimize` packs/sorts the tables and builds .IDX files afterwards; by default it
+    runs when the config file has a "DBF_OPTIMIZE" section. With `merge` the range is
+    exported to a staging directory and upserted into the existing tables instead of
+    replacing them (see merge.merge_into). Whenever the tables change, the .IDX files that
+    optimize manages (the "indexes" of DBF_OPTIMIZE) left by an earlier run are rebuilt, or
+    deleted when `optimize` is False, since they would point at the old records. Other
+    .IDX files in the folder are never touched.
+    With `snapshot` the DBFs are built from the local monthly copy of the facturas,
+    re-pulling only months that are missing or still open; `offline` uses the local copy
+    as it is, without contacting the server.
+    """
     target = Path(target_dir)
     target.mkdir(parents=True, exist_ok=True)
+    snapshot = snapshot or offline
+    mode = "snapshot" if snapshot else "local" if local else "incremental" if incremental else "chunked" if window else "server"
+    metrics = ExportMetrics(mode, base_url=base_url, desde=desde_iso, hasta=hasta_iso, target=str(target), window=window, merge=merge)
+    try:
+        cfg = load_config()
+        spec = cfg.get("DBF_OPTIMIZE")
+        # Only the tables and index files optimize manages; anything else in the folder is left alone
+        managed = spec or DEFAULT_OPTIMIZE
+        table_names = {f"{stem}.dbf".lower() for stem in managed}
+        index_names = {f"{name}.idx".lower() for options in managed.values() for name in (options.get("indexes") or {})}
+        tables_before, indexes_before = _file_stamps(target, table_names), _file_stamps(target, index_names)
+        if merge:
+            with staging_dir(target) as staging:
+                message = _dispatch_export(base_url, token, desde_iso, hasta_iso, staging, on_progress, window, max_workers, incremental, local, snapshot, offline, metrics)
+                with metrics.phase("merge"):
+                    merged = merge_into(staging, target, desde_iso, hasta_iso, cfg.get("DBF_MERGE") or None)
+            for counts in merged.values():
+                for name, value in counts.items():
+                    metrics.count(f"records_{name}", value)
+            message = "Archivos DBF actualizados correctamente (fusión del rango)."
+        else:
+            message = _dispatch_export(base_url, token, desde_iso, hasta_iso, target, on_progress, window, max_workers, incremental, local, snapshot, offline, metrics)
+        tables_changed = _file_stamps(target, table_names) != tables_before
+        if optimize or (optimize is None and (spec or (tables_changed and indexes_before))):
+            with metrics.phase("optimize"):
+                summary = optimize_tables(target, spec or None)
+            metrics.count("records_dropped", sum(t["dropped"] for t in summary.values()))
+            metrics.count("indexes_written", sum(len(t["indexes"]) for t in summary.values()))
+        if tables_changed:
+            # Managed indexes from an earlier run that nothing rewrote point at the old record numbers
+            indexes_after = _file_stamps(target, index_names)
+            stale = [path for path, stamp in indexes_before.items() if indexes_after.get(path) == stamp]
+            for path in stale:
+                path.unlink(missing_ok=True)
+            metrics.count("indexes_removed", len(stale))
+    except ExportCancelled:
+        metrics.emit("cancelled")
+        raise
+    except Exception as exc:
+        metrics.emit("error", f"{type(exc).__name__}: {exc}")
+        raise
+    metrics.emit("ok")
+    return message
+
+
+def _file_stamps(target: Path, names: Collection[str]) -> Dict[Path, Tuple[int, int, int]]:
+    # Identity of each file in `names` (lower case); publishing swaps inodes and merging bumps mtimes
+    stamps = {}
+    for path in target.iterdir():
+        if path.is_file() and path.name.lower() in names:
+            st = path.stat()
+            stamps[path] = (st.st_ino, st.st_size, st.st_mtime_ns)
+    return stamps
+
 
-    # Extract ZIP contents directly into target directory
-    with zipfile.ZipFile(BytesIO(blob)) as zf:
-        zf.extractall(path=target)
+def _dispatch_export(
+    base_url: str,
+    token: str,
+    desde_iso: str,
+    hasta_iso: str,
+    target: Path,
+    on_progress: ProgressCallback | None,
+    window: str | None,
+    max_workers: int,
+    incremental: bool,
+    local: bool,
+    snapshot: bool,
+    offline: bool,
+    metrics: ExportMetrics,
+) -> str:
+    if snapshot:
+        return _run_snapshot_export(base_url, token, desde_iso, hasta_iso, target, on_progress, offline, metrics)
+
+    if local:
+        return _run_local_export(base_url, token, desde_iso, hasta_iso, target, on_progress, metrics)
+
+    if incremental:
+        return _run_incremental_export(base_url, token, desde_iso, hasta_iso, target, on_progress, max_workers, metrics)
+
+    if window:
+        chunks = split_range(date.fromisoformat(desde_iso), date.fromisoformat(hasta_iso), window)
+        if len(chunks) > 1:
+            return _run_chunked_export(base_url, token, chunks, target, on_progress, max_workers, metrics)
+
+    with AjaxAPI(base_url=base_url, token=token, metrics=metrics) as api:
+        _download_and_extract(api, desde_iso, hasta_iso, target, on_progress)
 
     return "Archivos DBF descargados y extraídos correctamente."
 
 
-def export_via_gui(base_url: str, token: str, desde_ui: str, hasta_ui: str, target_dir: str) -> str:
-    # UI uses MM-DD-YYYY; convert to ISO
-    desde_dt = datetime.strptime(desde_ui, "%m-%d-%Y")
-    hasta_dt = datetime.strptime(hasta_ui, "%m-%d-%Y")
-    desde_iso = desde_dt.strftime("%Y-%m-%d")
-    hasta_iso = hasta_dt.strftime("%Y-%m-%d")
-    return run_export(base_url, token, desde_iso, hasta_iso, target_dir)
+def _run_local_export(
+    base_url: str,
+    token: str,
+    desde_iso: str,
+    hasta_iso: str,
+    target: Path,
+    on_progress: ProgressCallback | None,
+    metrics: ExportMetrics,
+) -> str:
+    layout = load_config().get("DBF_LAYOUT")
+    with AjaxAPI(base_url=base_url, token=token, metrics=metrics) as api:
+        facturas = api.iter_facturas(fecha_desde=desde_iso, fecha_hasta=hasta_iso)
+        with staging_dir(target) as staging:
+            # Includes waiting on the page prefetch; "request"/"transfer" show the network share
+            with metrics.phase("fetch_and_write"):
+                cab_rows, ite_rows = write_facturas(facturas, staging, layout=layout, on_progress=on_progress)
+            with metrics.phase("publish"):
+                publish(staging, target)
+    metrics.count("records_written", cab_rows + ite_rows)
+    return f"Archivos DBF generados localmente: {cab_rows} facturas, {ite_rows} líneas."
+
+
+def _run_snapshot_export(
+    base_url: str,
+    token: str,
+    desde_iso: str,
+    hasta_iso: str,
+    target: Path,
+    on_progress: ProgressCallback | None,
+    offline: bool,
+    metrics: ExportMetrics,
+) -> str:
+    cfg = load_config()
+    layout = cfg.get("DBF_LAYOUT") or DEFAULT_LAYOUT
+    snapshot = Snapshot(base_url, lines_key=layout.get("lines_key", "items"))
+    desde, hasta = date.fromisoformat(desde_iso), date.fromisoformat(hasta_iso)
+    if not offline:
+        with AjaxAPI(base_url=base_url, token=token, metrics=metrics) as api, metrics.phase("fetch"):
+            refreshed = snapshot.refresh(api, desde, hasta)
+        metrics.count("months_fetched", len(refreshed))
+    with staging_dir(target) as staging:
+        with metrics.phase("write"):
+            cab_rows, ite_rows = write_facturas(snapshot.iter_facturas(desde, hasta), staging, layout=layout, on_progress=on_progress)
+        with metrics.phase("publish"):
+            publish(staging, target)
+    metrics.count("records_written", cab_rows + ite_rows)
+    return f"Archivos DBF generados desde la copia local: {cab_rows} facturas, {ite_rows} líneas."
+
+
+def _run_parallel(
+    tasks: List[Callable[[ProgressCallback], T]],
+    on_progress: ProgressCallback | None,
+    workers: int,
+) -> List[T]:
+    """
+    Run download tasks on a bounded pool, folding their byte counters into a single
+    progress stream. The first failure (or cancellation) aborts the remaining tasks.
+    """
+    lock = threading.Lock()
+    received: Dict[int, int] = {}
+    totals: Dict[int, Optional[int]] = {}
+    failed = threading.Event()
+
+    def _progress_for(index: int) -> ProgressCallback:
+        def _report(done: int, total: Optional[int]) -> None:
+            if failed.is_set():
+                raise RuntimeError("Exportación abortada por un error en otro tramo")
+            with lock:
+                received[index] = done
+                totals[index] = total
+                overall = sum(received.values())
+                # Only report a total once every task knows its size
+                known = None
+                if len(totals) == len(tasks) and all(totals.values()):
+                    known = sum(t for t in totals.values() if t)
+            if on_progress is not None:
+                on_progress(overall, known)
+        return _report
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(tasks) or 1))) as pool:
+        futures = [pool.submit(task, _progress_for(i)) for i, task in enumerate(tasks)]
+        try:
+            for fut in as_completed(futures):
+                fut.result()
+        except BaseException:
+            failed.set()
+            for fut in futures:
+                fut.cancel()
+            raise
+    return [fut.result() for fut in futures]
+
+
+def _run_chunked_export(
+    base_url: str,
+    token: str,
+    chunks: List[Tuple[date, date]],
+    target: Path,
+    on_progress: ProgressCallback | None,
+    max_workers: int,
+    metrics: ExportMetrics,
+) -> str:
+    workers = max(1, min(max_workers, len(chunks)))
+    with tempfile.TemporaryDirectory(prefix="desktop_exporter_") as tmp:
+        staging = Path(tmp)
+        chunk_dirs = [staging / f"{i:04d}" for i in range(len(chunks))]
+        with AjaxAPI(base_url=base_url, token=token, pool_size=workers, metrics=metrics) as api:
+            tasks = [
+                partial(_download_and_extract, api, start.isoformat(), end.isoformat(), chunk_dir)
+                for (start, end), chunk_dir in zip(chunks, chunk_dirs)
+            ]
+            _run_parallel(tasks, on_progress, workers)
+
+        with metrics.phase("merge"):
+            _merge_chunk_dirs(chunk_dirs, target)
+        metrics.count("chunks", len(chunks))
+
+    return f"Archivos DBF descargados en {len(chunks)} tramos y unidos correctamente."
+
+
+def _run_incremental_export(
+    base_url: str,
+    token: str,
+    desde_iso: str,
+    hasta_iso: str,
+    target: Path,
+    on_progress: ProgressCallback | None,
+    max_workers: int,
+    metrics: ExportMetrics,
+) -> str:
+    cache = DayCache(base_url)
+    days = [start for start, _end in split_range(date.fromisoformat(desde_iso), date.fromisoformat(hasta_iso), "day")]
+    stale = [day for day in days if cache.needs_fetch(day)]
+
+    if stale:
+        cache.root.mkdir(parents=True, exist_ok=True)
+        workers = max(1, min(max_workers, len(stale)))
+
+        def _refresh(api: AjaxAPI, day: date, on_day_progress: ProgressCallback) -> None:
+            # Stage next to the cache so the final swap is a rename on the same volume
+            staging = Path(tempfile.mkdtemp(prefix=".staging-", dir=cache.root))
+            try:
+                info, sha256 = _download_and_extract(
+                    api, day.isoformat(), day.isoformat(), staging, on_day_progress, cache.validators(day)
+                )
+                previous = cache.meta(day) or {}
+                if info.not_modified or (sha256 and sha256 == previous.get("sha256")):
+                    cache.touch(day)
+                    metrics.count("days_unchanged")
+                else:
+                    cache.store(day, staging, sha256, info.etag, info.last_modified)
+                    metrics.count("days_updated")
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+
+        with AjaxAPI(base_url=base_url, token=token, pool_size=workers, metrics=metrics) as api:
+            _run_parallel([partial(_refresh, api, day) for day in stale], on_progress, workers)
+
+    metrics.count("days_from_cache", len(days) - len(stale))
+    with metrics.phase("merge"):
+        _merge_chunk_dirs([cache.day_dir(day) for day in days], target, skip={DayCache.META_NAME})
+    return f"Archivos DBF actualizados: {len(stale)} de {len(days)} días descargados."
+
+
+def _merge_chunk_dirs(chunk_dirs: List[Path], target: Path, skip: Collection[str] = ()) -> None:
+    # Member paths in chunk order, keyed case-insensitively (FoxPro does not care about case)
+    members: Dict[str, Tuple[Path, List[Path]]] = {}
+    for chunk_dir in chunk_dirs:
+        for path in sorted(p for p in chunk_dir.rglob("*") if p.is_file()):
+            rel = path.relative_to(chunk_dir)
+            if str(rel) in skip:
+                continue
+            members.setdefault(str(rel).lower(), (rel, []))[1].append(path)
+
+    # Build the merged tables next to the target and swap them in at the end
+    with staging_dir(target) as staging:
+        for rel, paths in members.values():
+            dest = staging / rel
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            if dest.suffix.lower() == ".dbf":
+                concat_tables(paths, dest)
+            elif dest.suffix.lower() == ".fpt":
+                raise ValueError(f"{rel} contiene campos memo; use la exportación sin tramos")
+            elif dest.suffix.lower() in (".cdx", ".idx", ".ntx", ".mdx"):
+                # An index from one window would describe only that window's records
+                raise ValueError(f"{rel} es un índice del servidor; use la exportación sin tramos")
+            else:
+                # Non-table members are identical across windows; keep the last one
+                shutil.copyfile(paths[-1], dest)
+        publish(staging, target)
+
+
+def run_profiles_export(
+    names: List[str],
+    desde_iso: str,
+    hasta_iso: str,
+    profile_workers: int = DEFAULT_PROFILE_WORKERS,
+    on_progress: ProgressCallback | None = None,
+    **options: Any,
+) -> Dict[str, Any]:
+    """
+    Export the same range for several named profiles at once. Each profile uses its own
+    base URL, cached login and target folder (and so its own client and staging dir);
+    one failing tenant does not stop the others. Returns {"ok", "profiles": [...]}.
+    """
+    profiles = load_profiles()
+    unknown = [name for name in names if name not in profiles]
+    if unknown:
+        raise ValueError(f"Perfiles desconocidos: {', '.join(unknown)}")
+
+    lock = threading.Lock()
+    received: Dict[str, int] = {}
+
+    def _progress_for(name: str) -> ProgressCallback:
+        def _report(done: int, total: Optional[int]) -> None:
+            with lock:
+                received[name] = done
+                overall = sum(received.values())
+            if on_progress is not None:
+                on_progress(overall, None)
+        return _report
+
+    def _export_profile(name: str) -> Dict[str, Any]:
+        profile = profiles[name]
+        result: Dict[str, Any] = {"profile": name, "base_url": profile["base_url"], "target": profile.get("target", "")}
+        started = time.perf_counter()
+        try:
+            if not profile.get("target"):
+                raise ValueError("El perfil no tiene carpeta destino")
+            cached = load_tokens(profile["base_url"], profile.get("email") or None)
+            if not cached:
+                raise PermissionError("Sin sesión guardada; inicie sesión con este perfil")
+            result["message"] = run_export(
+                profile["base_url"], cached["access"], desde_iso, hasta_iso, profile["target"],
+                on_progress=_progress_for(name), **options,
+            )
+            result["status"] = "ok"
+        except ExportCancelled:
+            result["status"] = "cancelled"
+        except Exception as exc:
+            result["status"] = "error"
+            result["error"] = f"{type(exc).__name__}: {exc}"
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, min(profile_workers, len(names) or 1))) as pool:
+        results = list(pool.map(_export_profile, names))
+    if any(r["status"] == "cancelled" for r in results):
+        raise ExportCancelled("Exportación cancelada")
+    return {"ok": all(r["status"] == "ok" for r in results), "profiles": results}
+
 
+def format_profiles_summary(summary: Dict[str, Any]) -> str:
+    lines = []
+    for result in summary["profiles"]:
+        detail = result.get("message") if result["status"] == "ok" else result.get("error", result["status"])
+        lines.append(f"{result['profile']}: {detail} ({result['seconds']:.1f} s)")
+    return "\n".join(lines)
 
@@ -1,16 +1,343 @@
 from __future__ import annotations
 
+import hashlib
+import json
 import os
-from typing import Dict, Any, List
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Any, Iterator, List, Callable, NamedTuple, Optional, Tuple
+from urllib.parse import urlencode, urljoin
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from desktop_exporter.config import _config_path
+from desktop_exporter.credentials import find_tokens, is_expired, load_tokens, save_tokens
+from desktop_exporter.filelock import lock_file, unlock_file
+from desktop_exporter.metrics import ExportMetrics
+
+
+# Bytes read from the socket per iteration when streaming large downloads
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+ProgressCallback = Callable[[int, Optional[int]], None]
+
+
+class DownloadInfo(NamedTuple):
+    received: int
+    status_code: int
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+    @property
+    def not_modified(self) -> bool:
+        return self.status_code == 304
+
+# Statuses worth retrying: rate limiting and Heroku router/dyno cold-start errors
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def build_session(retries: int = 3, backoff: float = 0.5, pool_size: int = 4) -> requests.Session:
+    """
+    Session with keep-alive connection pooling and retry/backoff for idempotent GETs.
+    Retry-After is honored on 429/503; POSTs (login) are never retried.
+    """
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({"GET", "HEAD"}),
+        respect_retry_after_header=True,
+        # Hand the final error response back so raise_for_status() reports it
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["Accept-Encoding"] = "gzip, deflate"
+    return session
+
+
+# Resumable downloads: how often the sidecar offset is saved, and how many times a
+# dropped connection is resumed within one call
+RESUME_SAVE_EVERY = 4 * 1024 * 1024
+RESUME_ATTEMPTS = 5
+# Socket reads are smaller than DOWNLOAD_CHUNK_SIZE so a dropped link loses at most this much
+RESUME_CHUNK_SIZE = 16 * 1024
+# Spool files left untouched this many seconds (crashed, cancelled or failed exports) are swept
+SPOOL_MAX_AGE = 24 * 3600
+_RESUMABLE_ERRORS = (requests.ConnectionError, requests.exceptions.ChunkedEncodingError, requests.Timeout)
+
+
+def _downloads_dir() -> Path:
+    return _config_path().with_name(".desktop_exporter_downloads")
+
+
+class PartialDownload:
+    """
+    Spool file plus a JSON sidecar (URL, params, validators, offset) for one export ZIP.
+    The same request maps to the same files, so a later attempt can continue with a
+    Range request. The shared files are guarded by an OS lock on a .lock file, which a
+    crash releases; a concurrent download of the same request, from this process or
+    another one (the GUI next to `cli --agent`), gets private files that are removed on
+    release instead.
+    """
+
+    def __init__(self, url: str, params: Dict[str, Any], directory: Path | None = None) -> None:
+        self.url = url
+        self.params = {k: str(v) for k, v in params.items()}
+        directory = directory or _downloads_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+        key = hashlib.sha1(f"{url}?{urlencode(sorted(self.params.items()))}".encode("utf-8")).hexdigest()[:20]
+        self.lock_path = directory / f"{key}.lock"
+        self._lock = lock_file(self.lock_path)
+        self.private = self._lock is None
+        if self.private:
+            key = f"{key}-{uuid.uuid4().hex[:8]}"
+        self.key = key
+        _sweep_spool(directory, key)
+        self.path = directory / f"{key}.part"
+        self.meta_path = directory / f"{key}.json"
+
+    def load_meta(self) -> Dict[str, Any]:
+        try:
+            with self.meta_path.open("r", encoding="utf-8") as fh:
+                meta = json.load(fh)
+        except Exception:
+            return {}
+        if meta.get("url") != self.url or meta.get("params") != self.params:
+            return {}
+        return meta
+
+    def save_meta(self, etag: str | None, last_modified: str | None, offset: int) -> None:
+        meta = {"url": self.url, "params": self.params, "etag": etag, "last_modified": last_modified, "offset": offset}
+        tmp = self.meta_path.with_suffix(".json.tmp")
+        with tmp.open("w", encoding="utf-8") as fh:
+            json.dump(meta, fh)
+        os.replace(tmp, self.meta_path)
+
+    def resume_point(self) -> Tuple[int, Optional[str]]:
+        """(offset, If-Range validator) to continue from, or (0, None) to start over."""
+        meta = self.load_meta()
+        # A weak ETag cannot be used with If-Range; dynamically built ZIPs need a validator
+        etag = meta.get("etag")
+        validator = etag if etag and not etag.startswith("W/") else meta.get("last_modified")
+        offset = int(meta.get("offset") or 0)
+        if not validator or offset <= 0 or not self.path.exists() or self.path.stat().st_size < offset:
+            return 0, None
+        # Drop anything written after the last saved offset
+        with self.path.open("r+b") as fh:
+            fh.truncate(offset)
+        return offset, validator
+
+    def discard(self) -> None:
+        for path in (self.path, self.meta_path):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def release(self) -> None:
+        """Give up the spool files: private ones are deleted, shared ones stay resumable."""
+        if self.private:
+            self.discard()
+            return
+        if self._lock is None:
+            return
+        if not self.path.exists():
+            # Nothing left to resume; drop the lock file while still holding it
+            try:
+                self.lock_path.unlink()
+            except OSError:
+                # Windows keeps open files
+                pass
+        unlock_file(self._lock)
+        self._lock = None
+
+
+def _sweep_spool(directory: Path, keep: str) -> None:
+    """
+    Delete spool files nobody touched for SPOOL_MAX_AGE: private ones (key-uuid) of a
+    process that died, and shared ones of exports that were cancelled or failed and never
+    retried. A shared pair is only removed while holding its lock, so a download in
+    progress elsewhere is left alone.
+    """
+    cutoff = time.time() - SPOOL_MAX_AGE
+    stems: Dict[str, List[Path]] = {}
+    for path in directory.iterdir():
+        stem, _, ext = path.name.partition(".")
+        if ext in ("part", "json", "json.tmp") and stem != keep:
+            stems.setdefault(stem, []).append(path)
+    for stem, paths in stems.items():
+        try:
+            if max(path.stat().st_mtime for path in paths) >= cutoff:
+                continue
+        except OSError:
+            continue
+        lock = None
+        if "-" not in stem:
+            lock = lock_file(directory / f"{stem}.lock")
+            if lock is None:
+                continue
+        for path in paths:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+        if lock is not None:
+            try:
+                (directory / f"{stem}.lock").unlink()
+            except OSError:
+                # Windows keeps open files
+                pass
+            unlock_file(lock)
+
+
+def validate_zip(path: Path) -> None:
+    """Raise zipfile.BadZipFile unless the central directory parses and every member CRC matches."""
+    with zipfile.ZipFile(path) as zf:
+        bad = zf.testzip()
+    if bad is not None:
+        raise zipfile.BadZipFile(f"CRC incorrecto en {bad}")
+
+
+# Refresh the access token this many seconds before it expires
+REFRESH_LEEWAY = 60
+
+
+class TokenManager:
+    """
+    Access/refresh JWT pair for one account on one base URL. Refreshes the access token
+    shortly before its `exp` and keeps the pair in the local credential cache, under the
+    account's email, so later launches and other clients reuse it instead of logging in again.
+    """
+
+    def __init__(self, base_url: str, access: str = "", refresh: str = "", persist: bool = True, email: str | None = None) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.access = access
+        self.refresh = refresh
+        self.email = email
+        self.persist = persist
+        self._lock = threading.Lock()
+        cached = None
+        if persist and not refresh:
+            # An explicitly passed token always wins (static keys carry no exp to compare);
+            # it only picks up the refresh token of the cached session it belongs to
+            cached = find_tokens(self.base_url, access) if access else load_tokens(self.base_url, email)
+        if cached:
+            self.access = cached["access"]
+            self.refresh = cached.get("refresh", "")
+            self.email = self.email or cached.get("email")
+
+    def set(self, access: str, refresh: str = "", email: str | None = None) -> None:
+        with self._lock:
+            self.access = access
+            self.refresh = refresh or self.refresh
+            if email is not None:
+                self.email = email
+            if self.persist:
+                save_tokens(self.base_url, self.access, self.refresh, email=self.email)
+
+    @property
+    def can_refresh(self) -> bool:
+        return bool(self.refresh) and not is_expired(self.refresh)
+
+    def needs_refresh(self) -> bool:
+        return bool(self.access) and self.can_refresh and is_expired(self.access, leeway=REFRESH_LEEWAY)
+
+    def refresh_access(self, session: requests.Session, timeout: int, stale: str | None = None) -> bool:
+        """
+        Exchange the refresh token for a new access token. `stale` is the token a failed
+        request used; if another thread already replaced it, nothing is sent.
+        Returns True when a usable new access token is in place.
+        """
+        with self._lock:
+            if stale is not None and self.access != stale:
+                return True
+            if not self.can_refresh:
+                return False
+            resp = session.post(f"{self.base_url}/api/token/refresh/", json={"refresh": self.refresh}, timeout=timeout)
+            if resp.status_code in (400, 401):
+                return False
+            resp.raise_for_status()
+            data = resp.json()
+            if not data.get("access"):
+                return False
+            self.access = data["access"]
+            # Servers with refresh rotation hand back a new refresh token too
+            self.refresh = data.get("refresh") or self.refresh
+            if self.persist:
+                save_tokens(self.base_url, self.access, self.refresh, email=self.email, login=False)
+            return True
 
 
 class AjaxAPI:
-    def __init__(self, base_url: str, token: str | None = None, timeout: int = 30) -> None:
+    def __init__(
+        self,
+        base_url: str,
+        token: str | None = None,
+        timeout: int = 30,
+        retries: int = 3,
+        backoff: float = 0.5,
+        pool_size: int = 4,
+        session: requests.Session | None = None,
+        persist_tokens: bool = True,
+        metrics: ExportMetrics | None = None,
+    ) -> None:
         self.base_url = base_url.rstrip("/")
-        self.token = token or os.getenv("AJAX_API_TOKEN", "")
+        self.tokens = TokenManager(self.base_url, access=token or os.getenv("AJAX_API_TOKEN", ""), persist=persist_tokens)
         self.timeout = timeout
+        # Throwaway recorder unless the caller wants the numbers
+        self.metrics = metrics or ExportMetrics("api")
+        self._owns_session = session is None
+        self.session = session or build_session(retries=retries, backoff=backoff, pool_size=pool_size)
+
+    def close(self) -> None:
+        if self._owns_session:
+            self.session.close()
+
+    def __enter__(self) -> "AjaxAPI":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    @property
+    def token(self) -> str:
+        return self.tokens.access
+
+    @token.setter
+    def token(self, value: str) -> None:
+        self.tokens.access = value
+
+    def _request(self, method: str, url: str, headers: Dict[str, str] | None = None, **kwargs: Any) -> requests.Response:
+        """Authenticated request that refreshes ahead of expiry and retries a 401 once after refreshing."""
+        if self.tokens.needs_refresh():
+            with self.metrics.phase("token_refresh"):
+                self.tokens.refresh_access(self.session, self.timeout)
+        sent = self.token
+        with self.metrics.phase("request"):
+            resp = self.session.request(method, url, headers={**self._headers(), **(headers or {})}, timeout=self.timeout, **kwargs)
+        self.metrics.record_response(resp)
+        if resp.status_code == 401:
+            with self.metrics.phase("token_refresh"):
+                refreshed = self.tokens.refresh_access(self.session, self.timeout, stale=sent)
+            if refreshed:
+                resp.close()
+                self.metrics.count("auth_retries")
+                with self.metrics.phase("request"):
+                    resp = self.session.request(method, url, headers={**self._headers(), **(headers or {})}, timeout=self.timeout, **kwargs)
+                self.metrics.record_response(resp)
+        return resp
 
     def _headers(self) -> Dict[str, str]:
         headers = {"Accept": "application/json"}
@@ -25,33 +352,173 @@ class AjaxAPI:
         """
         url = f"{self.base_url}/api/token/"
         payload = {"email": email, "password": password}
-        resp = requests.post(url, json=payload, timeout=self.timeout)
+        with self.metrics.phase("login"):
+            resp = self.session.post(url, json=payload, timeout=self.timeout)
         resp.raise_for_status()
         data = resp.json()
         access = data.get("access")
         if not access:
             raise ValueError("No 'access' token in response")
-        self.token = access
+        self.tokens.set(access, data.get("refresh", ""), email=email)
         return access
 
-    def fetch_facturas(self, fecha_desde: str, fecha_hasta: str) -> List[Dict[str, Any]]:
-        # Always target the integraciones endpoint
-        url = f"{self.base_url}/integraciones/api/facturas"
-        params = {"fecha_desde": fecha_desde, "fecha_hasta": fecha_hasta}
-        resp = requests.get(url, headers=self._headers(), params=params, timeout=self.timeout)
+    def _get_page(self, url: str, params: Dict[str, Any] | None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        resp = self._request("GET", url, params=params)
         resp.raise_for_status()
-        data = resp.json()
+        with self.metrics.phase("transfer"):
+            data = resp.json()
+        self.metrics.count("bytes_downloaded", len(resp.content))
+        self.metrics.count("pages")
         if isinstance(data, dict) and "results" in data:
-            return data["results"]
+            next_url = data.get("next")
+            return data["results"], urljoin(url, next_url) if next_url else None
         if isinstance(data, list):
-            return data
+            return data, None
         raise ValueError("Unexpected API response format for facturas")
 
+    def iter_facturas(self, fecha_desde: str, fecha_hasta: str, page_size: int | None = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yield facturas one at a time, following the `next` link of paginated responses.
+        The next page is requested in the background while the current one is consumed,
+        so at most two pages are held in memory.
+        """
+        url = f"{self.base_url}/integraciones/api/facturas"
+        params: Dict[str, Any] = {"fecha_desde": fecha_desde, "fecha_hasta": fecha_hasta}
+        if page_size:
+            params["page_size"] = page_size
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="facturas-prefetch") as prefetch:
+            pending = prefetch.submit(self._get_page, url, params)
+            try:
+                while pending is not None:
+                    records, next_url = pending.result()
+                    # The next link already carries the query string
+                    pending = prefetch.submit(self._get_page, next_url, None) if next_url else None
+                    yield from records
+                    del records
+            finally:
+                if pending is not None:
+                    pending.cancel()
+
+    def count_facturas(self, fecha_desde: str, fecha_hasta: str) -> Optional[int]:
+        """
+        Number of facturas in the range from the paginated response's "count", asking for
+        a single record. None when the endpoint is not paginated (counting would mean
+        downloading the whole range).
+        """
+        url = f"{self.base_url}/integraciones/api/facturas"
+        params = {"fecha_desde": fecha_desde, "fecha_hasta": fecha_hasta, "page_size": 1}
+        resp = self._request("GET", url, params=params, stream=True)
+        try:
+            resp.raise_for_status()
+            if "json" not in resp.headers.get("Content-Type", "") or int(resp.headers.get("Content-Length") or 0) > 1024 * 1024:
+                return None
+            data = resp.json()
+        finally:
+            resp.close()
+        if isinstance(data, dict) and isinstance(data.get("count"), int):
+            return data["count"]
+        return None
+
+    def fetch_facturas(self, fecha_desde: str, fecha_hasta: str) -> List[Dict[str, Any]]:
+        # Always target the integraciones endpoint; collects every page
+        return list(self.iter_facturas(fecha_desde, fecha_hasta))
+
     def download_dbf_zip(self, fecha_desde: str, fecha_hasta: str) -> bytes:
         url = f"{self.base_url}/integraciones/api/export_dbf"
         params = {"fecha_desde": fecha_desde, "fecha_hasta": fecha_hasta}
-        resp = requests.get(url, headers=self._headers(), params=params, timeout=self.timeout)
+        resp = self._request("GET", url, params=params)
         resp.raise_for_status()
         return resp.content
 
+    def download_dbf_zip_resumable(
+        self,
+        fecha_desde: str,
+        fecha_hasta: str,
+        partial: PartialDownload | None = None,
+        on_progress: ProgressCallback | None = None,
+        extra_headers: Dict[str, str] | None = None,
+        attempts: int = RESUME_ATTEMPTS,
+    ) -> DownloadInfo:
+        """
+        Download the DBF ZIP into `partial.path`, continuing an earlier interrupted transfer
+        with a Range/If-Range request when the server sent a validator. Servers that ignore
+        Range (200 instead of 206) get a full download. Dropped connections are resumed up to
+        `attempts` times; the finished ZIP is validated before returning. The caller owns
+        `partial` and should discard it once the ZIP has been used.
+        """
+        url = f"{self.base_url}/integraciones/api/export_dbf"
+        params = {"fecha_desde": fecha_desde, "fecha_hasta": fecha_hasta}
+        partial = partial or PartialDownload(url, params)
+        last_error: Exception | None = None
+        for _attempt in range(max(1, attempts)):
+            offset, validator = partial.resume_point()
+            # Byte ranges refer to the encoded body, so never let the transfer be re-encoded
+            headers = {"Accept-Encoding": "identity", **(extra_headers or {})}
+            if offset:
+                headers["Range"] = f"bytes={offset}-"
+                headers["If-Range"] = validator
+            etag = last_modified = None
+            received = 0
+            try:
+                with self._request("GET", url, headers=headers, params=params, stream=True) as resp:
+                    if resp.status_code == 416:
+                        partial.discard()
+                        continue
+                    resp.raise_for_status()
+                    etag = resp.headers.get("ETag")
+                    last_modified = resp.headers.get("Last-Modified")
+                    if resp.status_code == 304:
+                        return DownloadInfo(0, resp.status_code, etag, last_modified)
+                    if resp.status_code == 206:
+                        start = resp.headers.get("Content-Range", "").replace("bytes ", "").split("-")[0]
+                        if start != str(offset):
+                            partial.discard()
+                            continue
+                        self.metrics.count("resumed_downloads")
+                    else:
+                        offset = 0
+                    length = resp.headers.get("Content-Length")
+                    total = offset + int(length) if length and length.isdigit() else None
+                    received = offset
+                    saved = reported = offset
+                    partial.save_meta(etag, last_modified, offset)
+                    started = time.perf_counter()
+                    try:
+                        with partial.path.open("ab" if offset else "wb") as fh:
+                            for chunk in resp.iter_content(chunk_size=RESUME_CHUNK_SIZE):
+                                if not chunk:
+                                    continue
+                                fh.write(chunk)
+                                received += len(chunk)
+                                if received - saved >= RESUME_SAVE_EVERY:
+                                    fh.flush()
+                                    partial.save_meta(etag, last_modified, received)
+                                    saved = received
+                                # Progress keeps the pace of DOWNLOAD_CHUNK_SIZE reads
+                                if on_progress is not None and (received - reported >= DOWNLOAD_CHUNK_SIZE or received == total):
+                                    on_progress(received, total)
+                                    reported = received
+                            if on_progress is not None and received != reported:
+                                on_progress(received, total)
+                    finally:
+                        # Whatever reached disk can be resumed later, even after a cancel
+                        partial.save_meta(etag, last_modified, received)
+                        self.metrics.add_phase("transfer", time.perf_counter() - started)
+                        self.metrics.count("bytes_downloaded", received - offset)
+                    if total is not None and received < total:
+                        raise requests.exceptions.ChunkedEncodingError(f"Descarga incompleta: {received} de {total} bytes")
+            except _RESUMABLE_ERRORS as exc:
+                last_error = exc
+                self.metrics.count("download_interruptions")
+                continue
+            with self.metrics.phase("validate"):
+                try:
+                    validate_zip(partial.path)
+                except zipfile.BadZipFile:
+                    partial.discard()
+                    raise
+            return DownloadInfo(received, 200, etag, last_modified)
+        if last_error is not None:
+            raise last_error
+        raise RuntimeError("No se pudo completar la descarga del ZIP")
 
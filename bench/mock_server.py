@@ -0,0 +1,305 @@
+"""
+Local stand-in for the Ajax API used by the export benchmarks.
+
+Serves /api/token/, /api/token/refresh/, /integraciones/api/facturas (paginated) and
+/integraciones/api/export_dbf with synthetic invoices, configurable latency and
+failure injection:
+
+    python -m desktop_exporter.bench.mock_server --invoices-per-day 200 --latency 0.05
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import hashlib
+import io
+import json
+import random
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from desktop_exporter.local_export import write_facturas
+
+
+class MockSettings:
+    def __init__(
+        self,
+        invoices_per_day: int = 100,
+        lines_per_invoice: int = 5,
+        page_size: int = 500,
+        latency: float = 0.0,
+        failure_rate: float = 0.0,
+        token_ttl: int = 3600,
+        seed: int = 1234,
+        drop_rate: float = 0.0,
+    ) -> None:
+        self.invoices_per_day = invoices_per_day
+        self.lines_per_invoice = lines_per_invoice
+        self.page_size = page_size
+        # Seconds added before every response (time to first byte)
+        self.latency = latency
+        # Fraction of GETs answered with 503 + Retry-After, like a cold dyno
+        self.failure_rate = failure_rate
+        self.token_ttl = token_ttl
+        # Fraction of export_dbf bodies cut off halfway, like a dropped Wi-Fi link
+        self.drop_rate = drop_rate
+        self.seed = seed
+
+
+def _jwt(kind: str, ttl: int) -> str:
+    def part(obj: Dict[str, Any]) -> str:
+        return base64.urlsafe_b64encode(json.dumps(obj).encode()).decode().rstrip("=")
+    return f"{part({'alg': 'none'})}.{part({'token_type': kind, 'exp': int(time.time()) + ttl, 'jti': random.random()})}.mock"
+
+
+def _days(desde: date, hasta: date) -> Iterator[date]:
+    day = desde
+    while day <= hasta:
+        yield day
+        day += timedelta(days=1)
+
+
+def facturas_for_day(settings: MockSettings, day: date) -> Iterator[Dict[str, Any]]:
+    """Deterministic synthetic facturas for one day."""
+    rng = random.Random(f"{settings.seed}-{day.isoformat()}")
+    for n in range(settings.invoices_per_day):
+        items = []
+        for j in range(settings.lines_per_invoice):
+            qty = rng.randint(1, 20)
+            price = round(rng.uniform(1000, 250000), 2)
+            items.append({
+                "codigo": f"P{rng.randint(1, 99999):05d}",
+                "descripcion": f"Producto {j}",
+                "cantidad": qty,
+                "precio_unitario": price,
+                "iva": 10,
+                "subtotal": round(qty * price, 2),
+            })
+        total = round(sum(item["subtotal"] for item in items), 2)
+        yield {
+            # Fits the 15-character NUMERO column, so numbers stay unique per invoice
+            "numero": f"001-{day.strftime('%y%m%d')}{n:05d}",
+            "fecha": day.isoformat(),
+            "cliente": {"ruc": f"{rng.randint(100000, 9999999)}-{rng.randint(0, 9)}", "nombre": f"Cliente {rng.randint(1, 5000)}"},
+            "condicion": "CONTADO" if rng.random() < 0.7 else "CREDITO",
+            "iva_5": 0,
+            "iva_10": round(total / 11, 2),
+            "total": total,
+            "items": items,
+        }
+
+
+class MockAjaxServer:
+    def __init__(self, settings: MockSettings | None = None, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.settings = settings or MockSettings()
+        self.stats: Dict[str, int] = {"requests": 0, "failures_injected": 0, "drops_injected": 0, "range_requests": 0, "bytes_sent": 0}
+        self._zip_cache: Dict[Tuple[str, str], bytes] = {}
+        self._lock = threading.Lock()
+        self._workdir = tempfile.TemporaryDirectory(prefix="mock_ajax_")
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockAjaxServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self._workdir.cleanup()
+
+    def __enter__(self) -> "MockAjaxServer":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+    def export_zip(self, desde: date, hasta: date) -> bytes:
+        key = (desde.isoformat(), hasta.isoformat())
+        with self._lock:
+            cached = self._zip_cache.get(key)
+        if cached is not None:
+            return cached
+        out_dir = Path(tempfile.mkdtemp(dir=self._workdir.name))
+        facturas = (f for day in _days(desde, hasta) for f in facturas_for_day(self.settings, day))
+        write_facturas(facturas, out_dir)
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+            for name in ("movimcab.dbf", "movimite.dbf"):
+                zf.write(out_dir / name, name)
+        blob = buf.getvalue()
+        with self._lock:
+            self._zip_cache[key] = blob
+        return blob
+
+    def _handler_class(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def _send(self, status: int, body: bytes, content_type: str = "application/json", headers: Dict[str, str] | None = None) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(body)
+                with server._lock:
+                    server.stats["bytes_sent"] += len(body)
+
+            def _json(self, status: int, obj: Any) -> None:
+                self._send(status, json.dumps(obj).encode("utf-8"))
+
+            def _begin(self) -> bool:
+                with server._lock:
+                    server.stats["requests"] += 1
+                if server.settings.latency:
+                    time.sleep(server.settings.latency)
+                if self.command == "GET" and random.random() < server.settings.failure_rate:
+                    with server._lock:
+                        server.stats["failures_injected"] += 1
+                    self._send(503, b"", headers={"Retry-After": "0"})
+                    return False
+                return True
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get("Content-Length") or 0)
+                self.rfile.read(length)
+                if not self._begin():
+                    return
+                ttl = server.settings.token_ttl
+                if self.path.rstrip("/") == "/api/token":
+                    self._json(200, {"access": _jwt("access", ttl), "refresh": _jwt("refresh", ttl * 24)})
+                elif self.path.rstrip("/") == "/api/token/refresh":
+                    self._json(200, {"access": _jwt("access", ttl)})
+                else:
+                    self._json(404, {"detail": "Not found"})
+
+            def do_GET(self) -> None:
+                if not self._begin():
+                    return
+                parsed = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+                try:
+                    desde = date.fromisoformat(query["fecha_desde"])
+                    hasta = date.fromisoformat(query["fecha_hasta"])
+                except (KeyError, ValueError):
+                    self._json(400, {"detail": "fecha_desde/fecha_hasta requeridos"})
+                    return
+                if parsed.path.rstrip("/") == "/integraciones/api/facturas":
+                    self._facturas(parsed.path, query, desde, hasta)
+                elif parsed.path.rstrip("/") == "/integraciones/api/export_dbf":
+                    self._export(desde, hasta)
+                else:
+                    self._json(404, {"detail": "Not found"})
+
+            def _facturas(self, path: str, query: Dict[str, str], desde: date, hasta: date) -> None:
+                page = int(query.get("page", 1))
+                size = int(query.get("page_size", server.settings.page_size))
+                per_day = server.settings.invoices_per_day
+                count = per_day * ((hasta - desde).days + 1)
+                start = (page - 1) * size
+                results: List[Dict[str, Any]] = []
+                # Only materialise the days this page touches
+                first_day = start // per_day if per_day else 0
+                for offset_day in range(first_day, (hasta - desde).days + 1):
+                    day_start = offset_day * per_day
+                    if day_start >= start + size:
+                        break
+                    for i, factura in enumerate(facturas_for_day(server.settings, desde + timedelta(days=offset_day))):
+                        if start <= day_start + i < start + size:
+                            results.append(factura)
+                next_url = None
+                if start + size < count:
+                    next_url = f"{path}?{urlencode({**query, 'page': page + 1, 'page_size': size})}"
+                self._json(200, {"count": count, "next": next_url, "previous": None, "results": results})
+
+            def _export(self, desde: date, hasta: date) -> None:
+                blob = server.export_zip(desde, hasta)
+                etag = '"' + hashlib.sha1(blob).hexdigest() + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    self._send(304, b"", headers={"ETag": etag})
+                    return
+                start = 0
+                range_header = self.headers.get("Range", "")
+                if range_header.startswith("bytes=") and self.headers.get("If-Range", etag) == etag:
+                    start = int(range_header[len("bytes="):].split("-")[0] or 0)
+                    if start >= len(blob):
+                        self._send(416, b"", headers={"Content-Range": f"bytes */{len(blob)}"})
+                        return
+                    with server._lock:
+                        server.stats["range_requests"] += 1
+                body = blob[start:]
+                status = 206 if start else 200
+                headers = {"ETag": etag, "Accept-Ranges": "bytes"}
+                if start:
+                    headers["Content-Range"] = f"bytes {start}-{len(blob) - 1}/{len(blob)}"
+                if random.random() < server.settings.drop_rate and len(body) > 1:
+                    # Promise the full body, send half and hang up
+                    with server._lock:
+                        server.stats["drops_injected"] += 1
+                        server.stats["bytes_sent"] += len(body) // 2
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/zip")
+                    self.send_header("Content-Length", str(len(body)))
+                    for key, value in headers.items():
+                        self.send_header(key, value)
+                    self.end_headers()
+                    self.wfile.write(body[: len(body) // 2])
+                    self.wfile.flush()
+                    self.close_connection = True
+                    return
+                self._send(status, body, content_type="application/zip", headers=headers)
+
+        return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Servidor Ajax simulado para benchmarks")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--invoices-per-day", type=int, default=100)
+    parser.add_argument("--lines-per-invoice", type=int, default=5)
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    settings = MockSettings(
+        args.invoices_per_day,
+        args.lines_per_invoice,
+        args.page_size,
+        args.latency,
+        args.failure_rate,
+        drop_rate=args.drop_rate,
+    )
+    server = MockAjaxServer(settings, port=args.port)
+    print(f"Mock Ajax API en {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
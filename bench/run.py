@@ -0,0 +1,156 @@
+"""
+Export benchmarks against the local mock Ajax server.
+
+Each (size, path) pair runs in a fresh subprocess so peak RSS is measured per export:
+
+    python -m desktop_exporter.bench.run --sizes 1k,100k --paths server,chunked,local
+    python -m desktop_exporter.bench.run --sizes 1m --json bench_output.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from desktop_exporter.actions import split_range
+from desktop_exporter.bench.mock_server import MockAjaxServer, MockSettings
+
+
+SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+# Export paths: keyword arguments passed to run_export in the child process
+PATHS: Dict[str, Dict[str, Any]] = {
+    "server": {},
+    "chunked": {"window": "week"},
+    "local": {"local": True},
+    "incremental-cold": {"incremental": True},
+    "incremental-warm": {"incremental": True},
+}
+
+
+def _peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _child(args: argparse.Namespace) -> int:
+    from desktop_exporter.actions import run_export
+
+    options = PATHS[args.child]
+    started = time.perf_counter()
+    message = run_export(args.base, "", args.desde, args.hasta, args.target, **options)
+    seconds = time.perf_counter() - started
+    json.dump({"seconds": seconds, "peak_rss_mb": _peak_rss_mb(), "message": message}, sys.stdout)
+    return 0
+
+
+def _dir_size(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+def _run_case(base: str, path: str, desde: date, hasta: date, target: Path, home: Path) -> Dict[str, Any]:
+    env = dict(os.environ)
+    # Keep the incremental cache and token store out of the real profile
+    env["HOME"] = env["USERPROFILE"] = str(home)
+    env.pop("AJAX_API_TOKEN", None)
+    cmd = [
+        sys.executable, "-m", "desktop_exporter.bench.run", "--child", path,
+        "--base", base, "--desde", desde.isoformat(), "--hasta", hasta.isoformat(), "--target", str(target),
+    ]
+    wall_start = time.perf_counter()
+    proc = subprocess.run(cmd, capture_output=True, text=True, env=env)
+    wall = time.perf_counter() - wall_start
+    if proc.returncode != 0:
+        return {"path": path, "error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}"}
+    result = json.loads(proc.stdout)
+    result.update({"path": path, "wall_seconds": wall, "output_mb": round(_dir_size(target) / 1e6, 2)})
+    return result
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks de exportación contra un servidor Ajax simulado")
+    parser.add_argument("--sizes", default="1k,100k", help=f"Líneas por exportación: {','.join(SIZES)}")
+    parser.add_argument("--paths", default=",".join(PATHS), help=f"Caminos a medir: {','.join(PATHS)}")
+    parser.add_argument("--days", type=int, default=28, help="Días del rango exportado")
+    parser.add_argument("--lines-per-invoice", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.0, help="Latencia simulada por respuesta (s)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fracción de GET que responden 503")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Fracción de descargas cortadas a la mitad")
+    parser.add_argument("--json", dest="json_out", help="Guardar los resultados en este archivo")
+    parser.add_argument("--child", choices=PATHS, help=argparse.SUPPRESS)
+    parser.add_argument("--base", help=argparse.SUPPRESS)
+    parser.add_argument("--desde", help=argparse.SUPPRESS)
+    parser.add_argument("--hasta", help=argparse.SUPPRESS)
+    parser.add_argument("--target", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        return _child(args)
+
+    # Closed days only, so the warm incremental run is served from the cache
+    hasta = date.today() - timedelta(days=2)
+    desde = hasta - timedelta(days=args.days - 1)
+    paths = [p.strip() for p in args.paths.split(",") if p.strip()]
+    results: List[Dict[str, Any]] = []
+
+    for size_name in [s.strip().lower() for s in args.sizes.split(",") if s.strip()]:
+        lines = SIZES[size_name]
+        per_day = max(1, lines // (args.lines_per_invoice * args.days))
+        settings = MockSettings(
+            invoices_per_day=per_day,
+            lines_per_invoice=args.lines_per_invoice,
+            latency=args.latency,
+            failure_rate=args.failure_rate,
+            drop_rate=args.drop_rate,
+        )
+        with MockAjaxServer(settings) as server, tempfile.TemporaryDirectory(prefix="bench_") as tmp:
+            # Build the server-side ZIPs up front so DBF generation on the mock is not timed
+            server.export_zip(desde, hasta)
+            for window in ("week", "day"):
+                for start, end in split_range(desde, hasta, window):
+                    server.export_zip(start, end)
+            home = Path(tmp) / "home"
+            home.mkdir()
+            for path in paths:
+                target = Path(tmp) / path
+                result = _run_case(server.base_url, path, desde, hasta, target, home)
+                result.update({"size": size_name, "lines": per_day * args.days * args.lines_per_invoice})
+                if "seconds" in result and result["seconds"] > 0:
+                    result["lines_per_second"] = round(result["lines"] / result["seconds"])
+                results.append(result)
+                _print_row(result)
+            results[-1]["server_stats"] = dict(server.stats)
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, indent=2)
+    return 1 if any("error" in r for r in results) else 0
+
+
+def _print_row(result: Dict[str, Any]) -> None:
+    if "error" in result:
+        print(f"{result['size']:>5} {result['path']:<18} ERROR {result['error']}")
+        return
+    rss = result.get("peak_rss_mb")
+    print(
+        f"{result['size']:>5} {result['path']:<18} "
+        f"{result['seconds']:8.2f} s  {result.get('lines_per_second', 0):>10} líneas/s  "
+        f"{result['output_mb']:8.2f} MB  rss {rss if rss is not None else '-':>7} MB"
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
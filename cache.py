@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import shutil
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from desktop_exporter.config import _config_path
+
+
+def _cache_root() -> Path:
+    # Cache lives next to the config file
+    return _config_path().with_name(".desktop_exporter_cache")
+
+
+class DayCache:
+    """
+    Per-day store of extracted export_dbf results, keyed by (base URL, day).
+    Each day directory holds the DBF files plus a meta.json with the ZIP content hash
+    and the ETag/Last-Modified validators the server sent, if any.
+    """
+
+    META_NAME = "meta.json"
+
+    def __init__(self, base_url: str, root: Path | None = None, mutable_days: int = 1) -> None:
+        self.base_url = base_url.rstrip("/")
+        key = hashlib.sha1(self.base_url.encode("utf-8")).hexdigest()[:16]
+        self.root = (root or _cache_root()) / key
+        # A day may still change until this many days after it; copies fetched earlier are refetched
+        self.mutable_days = max(1, mutable_days)
+
+    def day_dir(self, day: date) -> Path:
+        return self.root / day.isoformat()
+
+    def meta(self, day: date) -> Optional[Dict[str, Any]]:
+        path = self.day_dir(day) / self.META_NAME
+        if not path.exists():
+            return None
+        try:
+            with path.open("r", encoding="utf-8") as fh:
+                return json.load(fh)
+        except Exception:
+            # Corrupt entry; treat as missing so it gets fetched again
+            return None
+
+    def is_final(self, day: date, meta: Dict[str, Any]) -> bool:
+        """A day is final once it was fetched `mutable_days` after it; earlier copies may be partial."""
+        try:
+            fetched_on = datetime.fromisoformat(meta["fetched_at"]).date()
+        except (KeyError, TypeError, ValueError):
+            return False
+        return fetched_on >= day + timedelta(days=self.mutable_days)
+
+    def needs_fetch(self, day: date) -> bool:
+        meta = self.meta(day)
+        return meta is None or not self.is_final(day, meta)
+
+    def validators(self, day: date) -> Dict[str, str]:
+        """Conditional request headers for a cached day, empty when it was never fetched."""
+        meta = self.meta(day) or {}
+        headers: Dict[str, str] = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def store(self, day: date, src_dir: Path, sha256: str, etag: str | None, last_modified: str | None) -> None:
+        """Replace the cached files for `day` with the contents of `src_dir` (same volume preferred)."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        meta = {
+            "base_url": self.base_url,
+            "day": day.isoformat(),
+            "sha256": sha256,
+            "etag": etag,
+            "last_modified": last_modified,
+            "fetched_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        with (src_dir / self.META_NAME).open("w", encoding="utf-8") as fh:
+            json.dump(meta, fh, ensure_ascii=False, indent=2)
+        dest = self.day_dir(day)
+        old = dest.with_name(dest.name + ".old")
+        shutil.rmtree(old, ignore_errors=True)
+        if dest.exists():
+            dest.rename(old)
+        shutil.move(str(src_dir), str(dest))
+        shutil.rmtree(old, ignore_errors=True)
+
+    def touch(self, day: date) -> None:
+        """Record that a mutable day was revalidated without changes."""
+        meta = self.meta(day)
+        if meta is None:
+            return
+        meta["fetched_at"] = datetime.now().isoformat(timespec="seconds")
+        with (self.day_dir(day) / self.META_NAME).open("w", encoding="utf-8") as fh:
+            json.dump(meta, fh, ensure_ascii=False, indent=2)
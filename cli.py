@@ -0,0 +1,230 @@
+"""
+Headless entry point for scheduled exports (Task Scheduler / cron).
+
+Only imports the export modules (api, actions, preview, config) so it starts fast and never touches Tk:
+
+    python -m desktop_exporter.cli --email ops@example.com --range 2024-01-01 2024-01-31 --target E:\\
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from typing import Any, Dict, List, Sequence
+
+from desktop_exporter.actions import WINDOWS, DEFAULT_CHUNK_WORKERS, run_export, run_profiles_export
+from desktop_exporter.api import AjaxAPI
+from desktop_exporter.config import load_config, load_profiles
+from desktop_exporter.jobs import JobEvent
+from desktop_exporter.preview import preview_range
+
+
+DEFAULT_BASE = "https://ajax-erp-2c56bc9ad64c.herokuapp.com"
+
+
+def _parse_day(value: str) -> str:
+    # Accept ISO dates plus the relative keywords handy for schedules
+    if value == "today":
+        return date.today().isoformat()
+    if value == "yesterday":
+        return (date.today() - timedelta(days=1)).isoformat()
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"fecha inválida: {value!r} (use YYYY-MM-DD, today o yesterday)")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="desktop_exporter.cli", description="Exporta DBF desde la API de Ajax sin interfaz gráfica.")
+    parser.add_argument("--base", help="URL base de la API (por defecto la del archivo de configuración)")
+    parser.add_argument("--token", default=os.getenv("AJAX_API_TOKEN", ""), help="Token JWT de acceso")
+    parser.add_argument("--email", help="Email para iniciar sesión si no se pasa --token")
+    parser.add_argument("--password", default=os.getenv("AJAX_API_PASSWORD", ""), help="Password (o AJAX_API_PASSWORD)")
+    parser.add_argument("--range", dest="ranges", nargs=2, action="append", default=[], metavar=("DESDE", "HASTA"), type=_parse_day, help="Rango a exportar en --target; repetible")
+    parser.add_argument("--target", default=os.getenv("EXPORT_TARGET", os.getcwd()), help="Carpeta destino para los --range")
+    parser.add_argument("--job", dest="jobs", nargs=3, action="append", default=[], metavar=("DESDE", "HASTA", "DESTINO"), help="Rango con su propia carpeta destino; repetible")
+    parser.add_argument("--profile", dest="profiles", action="append", default=[], help="Exportar los --range para este perfil (URL, sesión y destino propios); repetible")
+    parser.add_argument("--all-profiles", action="store_true", help="Exportar los --range para todos los perfiles configurados")
+    parser.add_argument("--workers", type=int, default=2, help="Exportaciones simultáneas")
+    parser.add_argument("--window", choices=WINDOWS, help="Dividir cada rango en tramos descargados en paralelo")
+    parser.add_argument("--chunk-workers", type=int, default=DEFAULT_CHUNK_WORKERS, help="Tramos simultáneos por exportación")
+    parser.add_argument("--incremental", action="store_true", help="Descargar solo los días que faltan en la caché local")
+    parser.add_argument("--local", action="store_true", help="Generar los DBF localmente desde las facturas")
+    parser.add_argument("--optimize", action="store_true", default=None, help="Compactar, ordenar e indexar (.idx) los DBF al terminar")
+    parser.add_argument("--snapshot", action="store_true", help="Generar los DBF desde la copia local de facturas (solo se actualizan los meses abiertos)")
+    parser.add_argument("--offline", action="store_true", help="Como --snapshot, pero sin conectarse al servidor")
+    parser.add_argument("--preview", action="store_true", help="Solo estimar facturas, tamaño y duración de cada rango, sin exportar")
+    parser.add_argument("--enqueue", action="store_true", help="Agregar los --range/--job/--profile a la cola persistente en lugar de ejecutarlos")
+    parser.add_argument("--schedule", nargs=4, metavar=("NOMBRE", "HH:MM", "DESDE", "HASTA"), help="Programar una exportación diaria (DESDE/HASTA: yesterday, today, today-N, ...) con --target o --profile")
+    parser.add_argument("--unschedule", metavar="NOMBRE", help="Eliminar una exportación programada")
+    parser.add_argument("--agent", action="store_true", help="Ejecutar la cola y las programaciones hasta interrumpir (Ctrl+C)")
+    parser.add_argument("--merge", action="store_true", help="Fusionar el rango en los DBF existentes en lugar de reemplazarlos")
+    return parser
+
+
+def _run_job(base: str, token: str, desde: str, hasta: str, target: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    started = time.perf_counter()
+    result: Dict[str, Any] = {"desde": desde, "hasta": hasta, "target": target}
+    try:
+        result["message"] = run_export(base, token, desde, hasta, target, **options)
+        result["status"] = "ok"
+    except Exception as exc:
+        result["status"] = "error"
+        result["error"] = f"{type(exc).__name__}: {exc}"
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def _run_profiles(parser: argparse.ArgumentParser, profiles: List[str], ranges: List[List[str]], workers: int, options: Dict[str, Any]) -> int:
+    results: List[Dict[str, Any]] = []
+    for desde, hasta in ranges:
+        try:
+            summary = run_profiles_export(profiles, desde, hasta, profile_workers=workers, **options)
+        except ValueError as exc:
+            parser.error(str(exc))
+        results.extend({"desde": desde, "hasta": hasta, **r} for r in summary["profiles"])
+    ok = all(r["status"] == "ok" for r in results)
+    json.dump({"ok": ok, "jobs": results}, sys.stdout, ensure_ascii=False)
+    sys.stdout.write("\n")
+    return 0 if ok else 1
+
+
+def _base_url(args: argparse.Namespace) -> str:
+    return (args.base or load_config().get("AJAX_API_BASE") or os.getenv("AJAX_API_BASE", DEFAULT_BASE)).strip()
+
+
+def _emit(document: Dict[str, Any]) -> None:
+    json.dump(document, sys.stdout, ensure_ascii=False)
+    sys.stdout.write("\n")
+    sys.stdout.flush()
+
+
+def _queue_options(options: Dict[str, Any]) -> Dict[str, Any]:
+    # Only what differs from run_export's defaults, so the same export queued from the
+    # GUI and from here collapses into one job
+    return {k: v for k, v in options.items() if v not in (None, False) and not (k == "max_workers" and v == DEFAULT_CHUNK_WORKERS)}
+
+
+def _enqueue(entries: List[tuple], options: Dict[str, Any]) -> int:
+    from desktop_exporter.job_queue import JobStore
+
+    store = JobStore()
+    queued = []
+    for desde, hasta, target, profile, base in entries:
+        job_id, created = store.enqueue(desde, hasta, target, profile=profile, base_url=base, options=_queue_options(options))
+        queued.append({"id": job_id, "created": created, "desde": desde, "hasta": hasta, "target": target, "profile": profile})
+    _emit({"ok": True, "queued": queued})
+    return 0
+
+
+def _run_queue_command(parser: argparse.ArgumentParser, args: argparse.Namespace, options: Dict[str, Any]) -> int:
+    from desktop_exporter.job_queue import ExportScheduler, JobStore
+
+    store = JobStore()
+    if args.unschedule:
+        store.delete_schedule(args.unschedule)
+    if args.schedule:
+        name, at, desde, hasta = args.schedule
+        profile = args.profiles[0] if args.profiles else None
+        try:
+            store.add_schedule(name, at, desde, hasta, "" if profile else args.target, profile=profile,
+                               base_url=None if profile else _base_url(args), options=_queue_options(options))
+        except ValueError as exc:
+            parser.error(str(exc))
+    if not args.agent:
+        _emit({"ok": True, "schedules": store.list_schedules()})
+        return 0
+
+    def _on_event(event: JobEvent) -> None:
+        # One JSON line per finished job, so the agent's output can be tailed or piped
+        if event.kind != "progress":
+            _emit({"job": event.job.id, "status": event.kind, "detail": event.payload})
+
+    scheduler = ExportScheduler(store, workers=args.workers, listener=_on_event).start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        scheduler.stop()
+    return 0
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    options = {
+        "window": args.window,
+        "max_workers": args.chunk_workers,
+        "incremental": args.incremental,
+        "local": args.local,
+        "optimize": args.optimize,
+        "merge": args.merge,
+        "snapshot": args.snapshot,
+        "offline": args.offline,
+    }
+    if args.schedule or args.unschedule or args.agent:
+        return _run_queue_command(parser, args, options)
+
+    jobs: List[List[str]] = [[desde, hasta, args.target] for desde, hasta in args.ranges]
+    for desde, hasta, target in args.jobs:
+        try:
+            jobs.append([_parse_day(desde), _parse_day(hasta), target])
+        except argparse.ArgumentTypeError as exc:
+            parser.error(str(exc))
+    if not jobs:
+        parser.error("indique al menos un --range o --job")
+
+    profiles = sorted(load_profiles()) if args.all_profiles else args.profiles
+    if profiles:
+        # Profiles carry their own target, so --job destinations do not apply
+        if args.jobs:
+            parser.error("con --profile use --range en lugar de --job")
+        if args.preview:
+            parser.error("--preview no se puede combinar con --profile")
+        if args.enqueue:
+            return _enqueue([(desde, hasta, "", name, None) for name in profiles for desde, hasta in args.ranges], options)
+        return _run_profiles(parser, profiles, args.ranges, args.workers, options)
+
+    base = _base_url(args)
+    if args.enqueue:
+        # Queued jobs log in with the cached session of their base URL when they run
+        return _enqueue([(desde, hasta, target, None, base) for desde, hasta, target in jobs], options)
+    token = args.token.strip()
+    if args.email:
+        try:
+            with AjaxAPI(base_url=base) as api:
+                token = api.login(args.email.strip(), args.password)
+        except Exception as exc:
+            json.dump({"ok": False, "error": f"login: {type(exc).__name__}: {exc}", "jobs": []}, sys.stdout)
+            sys.stdout.write("\n")
+            return 2
+
+    if args.preview:
+        try:
+            previews = [preview_range(base, token, desde, hasta) for desde, hasta, _target in jobs]
+        except Exception as exc:
+            json.dump({"ok": False, "error": f"preview: {type(exc).__name__}: {exc}", "previews": []}, sys.stdout)
+            sys.stdout.write("\n")
+            return 1
+        json.dump({"ok": True, "previews": previews}, sys.stdout, ensure_ascii=False)
+        sys.stdout.write("\n")
+        return 0
+
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = [pool.submit(_run_job, base, token, desde, hasta, target, options) for desde, hasta, target in jobs]
+        results = [fut.result() for fut in futures]
+
+    ok = all(r["status"] == "ok" for r in results)
+    json.dump({"ok": ok, "jobs": results}, sys.stdout, ensure_ascii=False)
+    sys.stdout.write("\n")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
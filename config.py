@@ -33,3 +33,28 @@ def save_config(config: Dict[str, Any]) -> None:
         # Best-effort; ignore persistence errors
         pass
 
+
+def load_profiles() -> Dict[str, Dict[str, Any]]:
+    """
+    Named export profiles: {"name": {"base_url": ..., "email": ..., "target": ...}}.
+    `email` selects the cached login of that account on the base URL (any account there
+    when empty); no passwords are stored.
+    """
+    profiles = load_config().get("PROFILES") or {}
+    return {name: dict(p) for name, p in profiles.items() if isinstance(p, dict) and p.get("base_url")}
+
+
+def save_profile(name: str, base_url: str, target: str, email: str = "") -> None:
+    cfg = load_config()
+    profiles = cfg.get("PROFILES") or {}
+    profiles[name] = {"base_url": base_url.strip().rstrip("/"), "email": email.strip(), "target": target.strip()}
+    cfg["PROFILES"] = profiles
+    save_config(cfg)
+
+
+def delete_profile(name: str) -> None:
+    cfg = load_config()
+    profiles = cfg.get("PROFILES") or {}
+    if profiles.pop(name, None) is not None:
+        cfg["PROFILES"] = profiles
+        save_config(cfg)
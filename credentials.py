@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import base64
+import json
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from desktop_exporter.config import _config_path
+from desktop_exporter.filelock import lock_file, unlock_file
+
+
+def _tokens_path() -> Path:
+    # Kept next to the config file, readable only by the current user where supported
+    return _config_path().with_name(".desktop_exporter_tokens.json")
+
+
+def token_expiry(token: str) -> Optional[float]:
+    """Return the `exp` claim of a JWT as a Unix timestamp, without verifying the signature."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(payload)).get("exp")
+        return float(exp) if exp is not None else None
+    except Exception:
+        return None
+
+
+def is_expired(token: str, leeway: float = 0.0) -> bool:
+    exp = token_expiry(token)
+    # Tokens without a readable exp are trusted until the server says otherwise
+    return exp is not None and exp - leeway <= time.time()
+
+
+def _load_all() -> Dict[str, Any]:
+    path = _tokens_path()
+    if not path.exists():
+        return {}
+    try:
+        with path.open("r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except Exception:
+        return {}
+
+
+def _save_all(data: Dict[str, Any]) -> None:
+    path = _tokens_path()
+    # Written aside and swapped in, so a concurrent reader never sees a truncated file
+    tmp = path.with_name(path.name + ".tmp")
+    try:
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            json.dump(data, fh, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+    except Exception:
+        # Best-effort; a missing cache only means logging in again
+        pass
+
+
+@contextmanager
+def _updating() -> Iterator[None]:
+    # Threads, the GUI and `cli --agent` refresh tokens at the same time; without the lock
+    # one read-modify-write drops another's rotated refresh token
+    try:
+        fh = lock_file(_tokens_path().with_name(".desktop_exporter_tokens.lock"), wait=True)
+    except OSError:
+        fh = None
+    try:
+        yield
+    finally:
+        if fh is not None:
+            unlock_file(fh)
+
+
+def _key(base_url: str, email: str | None) -> str:
+    # One entry per account; entries saved before accounts were told apart are keyed by base only
+    base = base_url.rstrip("/")
+    return f"{base}|{email.strip().lower()}" if email and email.strip() else base
+
+
+def _same_email(entry: Dict[str, Any], email: str | None) -> bool:
+    return (entry.get("email") or "").strip().lower() == (email or "").strip().lower()
+
+
+def _base_keys(data: Dict[str, Any], base_url: str) -> List[str]:
+    base = base_url.rstrip("/")
+    return [key for key in data if key == base or key.startswith(base + "|")]
+
+
+def _usable(entry: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if not entry or not entry.get("access"):
+        return None
+    if is_expired(entry["access"]) and (not entry.get("refresh") or is_expired(entry["refresh"])):
+        return None
+    return entry
+
+
+def load_tokens(base_url: str, email: str | None = None) -> Optional[Dict[str, str]]:
+    """
+    Cached {"email", "access", "refresh"} of `email` on `base_url` (without `email`, the
+    most recent login there), or None when absent or unusable.
+    """
+    data = _load_all()
+    if not email:
+        entries = sorted((data[key] for key in _base_keys(data, base_url)), key=lambda e: e.get("login_at", 0))
+        return _usable(entries[-1]) if entries else None
+    entry = data.get(_key(base_url, email))
+    if entry is None:
+        legacy = data.get(_key(base_url, None)) or {}
+        entry = legacy if _same_email(legacy, email) else None
+    return _usable(entry)
+
+
+def find_tokens(base_url: str, access: str) -> Optional[Dict[str, str]]:
+    """The cached session on `base_url` whose access token is `access`, if any."""
+    data = _load_all()
+    for key in _base_keys(data, base_url):
+        if data[key].get("access") == access:
+            return _usable(data[key])
+    return None
+
+
+def save_tokens(base_url: str, access: str, refresh: str = "", email: str | None = None, login: bool = True) -> None:
+    """Store a session; `login` makes it the base's default, a refresh (login=False) does not."""
+    with _updating():
+        _save_session(base_url, access, refresh, email, login)
+
+
+def _save_session(base_url: str, access: str, refresh: str, email: str | None, login: bool) -> None:
+    data = _load_all()
+    key, legacy_key = _key(base_url, email), _key(base_url, None)
+    entry = data.get(key)
+    if entry is None and key != legacy_key and _same_email(data.get(legacy_key) or {}, email):
+        # Move the base-only entry of this account under its own key
+        entry = data.pop(legacy_key)
+    entry = entry or {}
+    entry.update({"access": access, "refresh": refresh or entry.get("refresh", "")})
+    if login:
+        entry["login_at"] = time.time()
+    if email is not None:
+        entry["email"] = email
+    data[key] = entry
+    _save_all(data)
+
+
+def clear_tokens(base_url: str, email: str | None = None) -> None:
+    """Forget the session of `email` on `base_url`, or every session there without `email`."""
+    with _updating():
+        data = _load_all()
+        keys = [key for key in _base_keys(data, base_url) if not email or _same_email(data[key], email)]
+        for key in keys:
+            del data[key]
+        if keys:
+            _save_all(data)
@@ -0,0 +1,262 @@
+from __future__ import annotations
+
+import struct
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Iterable, List, NamedTuple, Optional, Sequence
+
+
+# xBase header layout: version, YY MM DD of last update, record count, header length, record length
+_HEADER = struct.Struct("<B3BIHH")
+EOF_MARKER = b"\x1a"
+COPY_BUFFER = 1024 * 1024
+
+
+class DBFHeader(NamedTuple):
+    version: int
+    record_count: int
+    header_length: int
+    record_length: int
+    # Raw bytes from offset 32 up to header_length: field descriptors, terminator and VFP backlink
+    descriptors: bytes
+
+
+def read_header(fh: BinaryIO) -> DBFHeader:
+    fh.seek(0)
+    head = fh.read(32)
+    if len(head) < 32:
+        raise ValueError("Archivo DBF truncado")
+    version, _yy, _mm, _dd, count, header_len, record_len = _HEADER.unpack_from(head)
+    descriptors = fh.read(header_len - 32)
+    return DBFHeader(version, count, header_len, record_len, descriptors)
+
+
+class FieldSlot(NamedTuple):
+    name: str
+    type: str
+    offset: int  # from the start of the record, deletion flag included
+    length: int
+    decimals: int
+
+
+def read_fields(header: DBFHeader) -> List[FieldSlot]:
+    """Parse the field descriptors of a header into name/type/offset/length entries."""
+    fields: List[FieldSlot] = []
+    offset = 1
+    desc = header.descriptors
+    for pos in range(0, len(desc) - 31, 32):
+        if desc[pos] == 0x0D:
+            break
+        name = desc[pos:pos + 11].split(b"\x00", 1)[0].decode("ascii", errors="replace").upper()
+        length, decimals = desc[pos + 16], desc[pos + 17]
+        fields.append(FieldSlot(name, chr(desc[pos + 11]), offset, length, decimals))
+        offset += length
+    return fields
+
+
+def record_key(record: bytes, slots: Sequence[FieldSlot]) -> bytes:
+    """Raw bytes of `slots` in a record, concatenated; byte order matches FoxPro's key order."""
+    return b"".join(record[s.offset:s.offset + s.length] for s in slots)
+
+
+def find_table(directory: Path, stem: str) -> Optional[Path]:
+    """The .dbf named `stem` in `directory`, matched case-insensitively like FoxPro does."""
+    for path in directory.iterdir():
+        if path.is_file() and path.stem.lower() == stem.lower() and path.suffix.lower() == ".dbf":
+            return path
+    return None
+
+
+def write_header(fh: BinaryIO, raw_head: bytes, record_count: int) -> None:
+    """Write `raw_head` (a full header block) with the record count and update date refreshed."""
+    today = date.today()
+    head = bytearray(raw_head)
+    struct.pack_into("<3BI", head, 1, today.year - 1900, today.month, today.day, record_count)
+    fh.seek(0)
+    fh.write(head)
+
+
+def concat_tables(sources: List[Path], dest: Path) -> int:
+    """
+    Append the records of every DBF in `sources` into a single table at `dest`.
+    All sources must share the exact same field layout. Returns the total record count.
+    """
+    if not sources:
+        raise ValueError("No hay tablas para unir")
+    headers = []
+    for src in sources:
+        with src.open("rb") as fh:
+            headers.append(read_header(fh))
+    first = headers[0]
+    for src, hdr in zip(sources, headers):
+        if hdr.descriptors != first.descriptors or hdr.record_length != first.record_length:
+            raise ValueError(f"Estructura DBF distinta en {src.name}; no se puede unir")
+
+    total = sum(hdr.record_count for hdr in headers)
+    with sources[0].open("rb") as fh:
+        raw_head = fh.read(first.header_length)
+    with dest.open("wb") as out:
+        write_header(out, raw_head, total)
+        for src, hdr in zip(sources, headers):
+            with src.open("rb") as fh:
+                fh.seek(hdr.header_length)
+                _copy_exact(fh, out, hdr.record_count * hdr.record_length)
+        out.write(EOF_MARKER)
+    return total
+
+
+def _copy_exact(src: BinaryIO, dst: BinaryIO, length: int) -> None:
+    remaining = length
+    while remaining > 0:
+        chunk = src.read(min(COPY_BUFFER, remaining))
+        if not chunk:
+            raise ValueError("Archivo DBF truncado")
+        dst.write(chunk)
+        remaining -= len(chunk)
+
+
+# Visual FoxPro table without memo fields, cp1252 code page mark
+VFP_VERSION = 0x30
+VFP_CODEPAGE_1252 = 0x03
+VFP_BACKLINK_SIZE = 263
+DEFAULT_BATCH = 4096
+
+
+class Field(NamedTuple):
+    name: str
+    type: str  # C, N, D or L
+    length: int
+    decimals: int = 0
+
+
+def _char_encoder(field: Field, encoding: str) -> Callable[[Any], bytes]:
+    width = field.length
+
+    def encode(value: Any) -> bytes:
+        raw = b"" if value is None else str(value).encode(encoding, errors="replace")
+        return raw[:width].ljust(width, b" ")
+    return encode
+
+
+def _numeric_encoder(field: Field, encoding: str) -> Callable[[Any], bytes]:
+    width, decimals = field.length, field.decimals
+    blank = b" " * width
+
+    def encode(value: Any) -> bytes:
+        if value is None or value == "":
+            return blank
+        raw = f"{float(value):{width}.{decimals}f}".encode("ascii")
+        if len(raw) > width:
+            raise ValueError(f"Valor {value!r} no entra en {field.name} N({width},{decimals})")
+        return raw
+    return encode
+
+
+def _date_encoder(field: Field, encoding: str) -> Callable[[Any], bytes]:
+    def encode(value: Any) -> bytes:
+        if not value:
+            return b" " * 8
+        if isinstance(value, (date, datetime)):
+            return value.strftime("%Y%m%d").encode("ascii")
+        # ISO strings from the API: YYYY-MM-DD or a full timestamp
+        text = str(value)[:10].replace("-", "")
+        if len(text) != 8 or not text.isdigit():
+            raise ValueError(f"Fecha inválida para {field.name}: {value!r}")
+        return text.encode("ascii")
+    return encode
+
+
+def _logical_encoder(field: Field, encoding: str) -> Callable[[Any], bytes]:
+    def encode(value: Any) -> bytes:
+        if value is None:
+            return b"?"
+        return b"T" if value else b"F"
+    return encode
+
+
+_ENCODERS = {"C": _char_encoder, "N": _numeric_encoder, "D": _date_encoder, "L": _logical_encoder}
+
+
+class DBFWriter:
+    """
+    Streaming writer for Visual FoxPro tables with a fixed record layout.
+    Records are encoded into a preallocated batch buffer and flushed in bulk; the
+    record count in the header is patched when the writer is closed.
+    """
+
+    def __init__(self, path: Path, fields: Sequence[Field], encoding: str = "cp1252", batch_size: int = DEFAULT_BATCH) -> None:
+        for field in fields:
+            if field.type not in _ENCODERS:
+                raise ValueError(f"Tipo de campo no soportado: {field.type}")
+            if field.type == "D" and field.length != 8:
+                raise ValueError(f"El campo fecha {field.name} debe tener longitud 8")
+        self.path = Path(path)
+        self.fields = list(fields)
+        self.record_length = 1 + sum(field.length for field in self.fields)
+        self.count = 0
+        self._encoders = [_ENCODERS[field.type](field, encoding) for field in self.fields]
+        self._batch_size = batch_size
+        self._buffer = bytearray(self.record_length * batch_size)
+        self._pending = 0
+        self._fh = self.path.open("wb")
+        self._raw_head = self._build_header()
+        self._fh.write(self._raw_head)
+
+    def _build_header(self) -> bytes:
+        header_length = 32 + 32 * len(self.fields) + 1 + VFP_BACKLINK_SIZE
+        head = bytearray(32)
+        _HEADER.pack_into(head, 0, VFP_VERSION, 0, 1, 1, 0, header_length, self.record_length)
+        head[29] = VFP_CODEPAGE_1252
+        offset = 1
+        for field in self.fields:
+            desc = bytearray(32)
+            name = field.name.upper().encode("ascii")[:10]
+            desc[0:len(name)] = name
+            desc[11] = ord(field.type)
+            struct.pack_into("<I", desc, 12, offset)
+            desc[16] = field.length
+            desc[17] = field.decimals
+            head += desc
+            offset += field.length
+        head += b"\r" + bytes(VFP_BACKLINK_SIZE)
+        return bytes(head)
+
+    def append(self, values: Sequence[Any]) -> None:
+        start = self._pending * self.record_length
+        buf = self._buffer
+        buf[start] = 0x20  # not deleted
+        pos = start + 1
+        for encode, value, field in zip(self._encoders, values, self.fields):
+            buf[pos:pos + field.length] = encode(value)
+            pos += field.length
+        self._pending += 1
+        self.count += 1
+        if self._pending == self._batch_size:
+            self.flush()
+
+    def append_many(self, rows: Iterable[Sequence[Any]]) -> None:
+        for values in rows:
+            self.append(values)
+
+    def flush(self) -> None:
+        if self._pending:
+            self._fh.write(memoryview(self._buffer)[:self._pending * self.record_length])
+            self._pending = 0
+
+    @property
+    def bytes_written(self) -> int:
+        return len(self._raw_head) + (self.count - self._pending) * self.record_length
+
+    def close(self) -> None:
+        if self._fh.closed:
+            return
+        self.flush()
+        self._fh.write(EOF_MARKER)
+        write_header(self._fh, self._raw_head, self.count)
+        self._fh.close()
+
+    def __enter__(self) -> "DBFWriter":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import os
+import shutil
+import tempfile
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path, PurePosixPath
+from typing import Iterator, List, Tuple
+
+
+DEFAULT_EXTRACT_WORKERS = 4
+_READ_BLOCK = 1024 * 1024
+
+
+def file_crc32(path: Path) -> int:
+    crc = 0
+    with path.open("rb") as fh:
+        for block in iter(lambda: fh.read(_READ_BLOCK), b""):
+            crc = zlib.crc32(block, crc)
+    return crc
+
+
+def _same_file(staged: Path, dest: Path) -> bool:
+    try:
+        if dest.stat().st_size != staged.stat().st_size:
+            return False
+    except FileNotFoundError:
+        return False
+    return file_crc32(staged) == file_crc32(dest)
+
+
+@contextmanager
+def staging_dir(target: Path) -> Iterator[Path]:
+    """
+    Temporary directory inside `target`, so publishing is a rename on the same volume.
+    It is removed afterwards whether or not everything was published.
+    """
+    target.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(prefix=".desktop_exporter_staging-", dir=target))
+    try:
+        yield staging
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def publish(staging: Path, target: Path, check_unchanged: bool = True) -> Tuple[List[str], List[str]]:
+    """
+    Move every file under `staging` into `target` with os.replace, so readers see either
+    the old or the new file and never a half-written one. Files whose bytes already match
+    the destination are left alone. Returns (written, skipped) relative names.
+    """
+    written: List[str] = []
+    skipped: List[str] = []
+    for staged in sorted(p for p in staging.rglob("*") if p.is_file()):
+        rel = staged.relative_to(staging)
+        dest = target / rel
+        if check_unchanged and _same_file(staged, dest):
+            skipped.append(str(rel))
+            continue
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(staged, dest)
+        written.append(str(rel))
+    return written, skipped
+
+
+def _safe_member_path(name: str) -> PurePosixPath:
+    rel = PurePosixPath(name.replace("\\", "/"))
+    if rel.is_absolute() or ".." in rel.parts or (rel.parts and ":" in rel.parts[0]):
+        raise ValueError(f"Ruta insegura en el ZIP: {name!r}")
+    return rel
+
+
+def _member_unchanged(info: zipfile.ZipInfo, dest: Path) -> bool:
+    try:
+        if dest.stat().st_size != info.file_size:
+            return False
+    except FileNotFoundError:
+        return False
+    return file_crc32(dest) == info.CRC
+
+
+def extract_zip(zf: zipfile.ZipFile, target: Path, workers: int = DEFAULT_EXTRACT_WORKERS) -> Tuple[List[str], List[str]]:
+    """
+    Extract `zf` into `target` atomically. Members whose CRC32 and size match the existing
+    file are skipped without being decompressed; the rest are decompressed in parallel
+    into a staging directory inside `target` and then swapped in with os.replace.
+    Returns (written, skipped) member names.
+    """
+    target.mkdir(parents=True, exist_ok=True)
+    changed: List[Tuple[zipfile.ZipInfo, PurePosixPath]] = []
+    skipped: List[str] = []
+    for info in zf.infolist():
+        if info.is_dir():
+            continue
+        rel = _safe_member_path(info.filename)
+        if _member_unchanged(info, target / rel):
+            skipped.append(info.filename)
+        else:
+            changed.append((info, rel))
+    if not changed:
+        return [], skipped
+
+    with staging_dir(target) as staging:
+        def _extract(item: Tuple[zipfile.ZipInfo, PurePosixPath]) -> None:
+            info, rel = item
+            out_path = staging / rel
+            out_path.parent.mkdir(parents=True, exist_ok=True)
+            # ZipFile serialises access to the underlying file; zlib releases the GIL
+            with zf.open(info) as src, out_path.open("wb") as dst:
+                shutil.copyfileobj(src, dst, _READ_BLOCK)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(changed)))) as pool:
+            list(pool.map(_extract, changed))
+        written, _same = publish(staging, target, check_unchanged=False)
+    return written, skipped
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+
+def lock_file(path: Path, wait: bool = False) -> Optional[BinaryIO]:
+    """
+    Open and exclusively lock `path` across processes (an OS lock, so a crash releases
+    it). Without `wait`, returns None when another handle holds it.
+    """
+    while True:
+        fh = path.open("a+b")
+        try:
+            if fcntl is not None:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX | (0 if wait else fcntl.LOCK_NB))
+            else:
+                fh.seek(0)
+                # LK_LOCK gives up after about 10 seconds; the loop keeps waiting
+                msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK if wait else msvcrt.LK_NBLCK, 1)
+            # The holder may have deleted the file meanwhile; a lock on the old one guards nothing
+            if os.fstat(fh.fileno()).st_ino != os.stat(path).st_ino:
+                raise OSError("lock file replaced")
+            return fh
+        except OSError:
+            fh.close()
+            if not wait:
+                return None
+
+
+def unlock_file(fh: BinaryIO) -> None:
+    if fcntl is None:
+        fh.seek(0)
+        msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+    fh.close()
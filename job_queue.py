@@ -0,0 +1,480 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time as dtime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Mapping, Optional, Set, Tuple
+
+from desktop_exporter.config import _config_path, load_config, load_profiles
+from desktop_exporter.credentials import load_tokens
+from desktop_exporter.jobs import ExportCancelled, Job, JobEvent
+
+
+# Job states; "pending" and "running" are the live ones
+PENDING, RUNNING, DONE, ERROR, CANCELLED = "pending", "running", "done", "error", "cancelled"
+DEFAULT_QUEUE_WORKERS = 1
+POLL_SECONDS = 15
+# A running job whose owner has not refreshed its heartbeat for this long was orphaned
+# by a crash and goes back to pending (its partial download resumes)
+STALE_SECONDS = 120
+# Interrupted runs are retried this many times before the job is marked failed
+MAX_ATTEMPTS = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL,
+    desde TEXT NOT NULL,
+    hasta TEXT NOT NULL,
+    target TEXT NOT NULL DEFAULT '',
+    profile TEXT,
+    base_url TEXT,
+    options TEXT NOT NULL DEFAULT '{}',
+    schedule_id INTEGER,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    heartbeat TEXT,
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT,
+    message TEXT,
+    error TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_pending_key ON jobs(key) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, id);
+CREATE TABLE IF NOT EXISTS schedules (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL UNIQUE,
+    at TEXT NOT NULL,
+    desde TEXT NOT NULL,
+    hasta TEXT NOT NULL,
+    target TEXT NOT NULL DEFAULT '',
+    profile TEXT,
+    base_url TEXT,
+    options TEXT NOT NULL DEFAULT '{}',
+    enabled INTEGER NOT NULL DEFAULT 1,
+    next_run TEXT NOT NULL,
+    last_run TEXT
+);
+"""
+
+
+def _queue_path() -> Path:
+    return _config_path().with_name(".desktop_exporter_jobs.sqlite3")
+
+
+def _now() -> datetime:
+    return datetime.now().replace(microsecond=0)
+
+
+def resolve_day(expr: str, today: date | None = None) -> str:
+    """
+    Schedule day expressions: an ISO date, "today", "yesterday", "today-N" (N days ago),
+    "month_start" or "last_month_start" / "last_month_end".
+    """
+    today = today or date.today()
+    expr = expr.strip().lower()
+    if expr == "today":
+        return today.isoformat()
+    if expr == "yesterday":
+        return (today - timedelta(days=1)).isoformat()
+    if expr.startswith("today-") and expr[6:].isdigit():
+        return (today - timedelta(days=int(expr[6:]))).isoformat()
+    if expr == "month_start":
+        return today.replace(day=1).isoformat()
+    if expr == "last_month_end":
+        return (today.replace(day=1) - timedelta(days=1)).isoformat()
+    if expr == "last_month_start":
+        return (today.replace(day=1) - timedelta(days=1)).replace(day=1).isoformat()
+    try:
+        return date.fromisoformat(expr).isoformat()
+    except ValueError:
+        raise ValueError(f"Fecha inválida: {expr!r} (use YYYY-MM-DD, today, yesterday, today-N, month_start, last_month_start o last_month_end)")
+
+
+def _next_run(at: str, after: datetime) -> datetime:
+    hour, minute = (int(part) for part in at.split(":"))
+    candidate = datetime.combine(after.date(), dtime(hour, minute))
+    return candidate if candidate > after else candidate + timedelta(days=1)
+
+
+def job_key(desde: str, hasta: str, target: str, profile: Optional[str], base_url: Optional[str], options: Mapping[str, Any]) -> str:
+    """Identity of a job: two requests for the same export collapse while pending."""
+    blob = json.dumps([desde, hasta, target, profile, (base_url or "").rstrip("/"), dict(options)], sort_keys=True)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()
+
+
+class JobStore:
+    """
+    SQLite-backed export queue and daily schedules, kept next to the config file. Every
+    change is one transaction (WAL journal), so a crash never loses or half-writes a job,
+    and several processes may share the file.
+    """
+
+    def __init__(self, path: Path | None = None) -> None:
+        self.path = path or _queue_path()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def _transaction(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return result
+
+    def _enqueue(self, db: sqlite3.Connection, desde: str, hasta: str, target: str, profile: Optional[str],
+                 base_url: Optional[str], options: Mapping[str, Any], schedule_id: Optional[int]) -> Tuple[int, bool]:
+        key = job_key(desde, hasta, target, profile, base_url, options)
+        row = db.execute("SELECT id FROM jobs WHERE key = ? AND status = ?", (key, PENDING)).fetchone()
+        if row is not None:
+            return row["id"], False
+        cur = db.execute(
+            "INSERT INTO jobs (key, desde, hasta, target, profile, base_url, options, schedule_id, status, created_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, desde, hasta, target, profile, base_url, json.dumps(dict(options), sort_keys=True), schedule_id, PENDING, _now().isoformat()),
+        )
+        return cur.lastrowid, True
+
+    def enqueue(
+        self,
+        desde: str,
+        hasta: str,
+        target: str = "",
+        profile: str | None = None,
+        base_url: str | None = None,
+        options: Mapping[str, Any] | None = None,
+    ) -> Tuple[int, bool]:
+        """Queue an export. Returns (job id, created); an identical pending job is reused."""
+        if not profile and not (base_url and target):
+            raise ValueError("Indique un perfil o una URL base y una carpeta destino")
+        return self._transaction(lambda db: self._enqueue(db, desde, hasta, target, profile, base_url, options or {}, None))
+
+    def claim(self, owner: str, profiles: bool | None = None) -> Optional[Dict[str, Any]]:
+        """
+        Atomically take the oldest pending job for `owner` (marks it running); `profiles`
+        limits it to profile jobs (True) or plain ones (False). A job that already used
+        MAX_ATTEMPTS is failed instead and returned with status "error".
+        """
+        where = "" if profiles is None else " AND profile IS NOT NULL" if profiles else " AND profile IS NULL"
+
+        def _claim(db: sqlite3.Connection) -> Optional[Dict[str, Any]]:
+            row = db.execute(f"SELECT * FROM jobs WHERE status = ?{where} ORDER BY id LIMIT 1", (PENDING,)).fetchone()
+            if row is None:
+                return None
+            now = _now().isoformat()
+            if row["attempts"] >= MAX_ATTEMPTS:
+                error = "Interrumpida demasiadas veces"
+                db.execute("UPDATE jobs SET status = ?, finished_at = ?, error = ? WHERE id = ?", (ERROR, now, error, row["id"]))
+                return {**dict(row), "status": ERROR, "error": error}
+            db.execute(
+                "UPDATE jobs SET status = ?, owner = ?, heartbeat = ?, started_at = ?, attempts = attempts + 1 WHERE id = ?",
+                (RUNNING, owner, now, now, row["id"]),
+            )
+            return {**dict(row), "status": RUNNING, "owner": owner, "attempts": row["attempts"] + 1}
+        return self._transaction(_claim)
+
+    def heartbeat(self, owner: str) -> None:
+        self._transaction(lambda db: db.execute("UPDATE jobs SET heartbeat = ? WHERE owner = ? AND status = ?", (_now().isoformat(), owner, RUNNING)))
+
+    def finish(self, job_id: int, status: str, message: str | None = None, error: str | None = None) -> None:
+        def _finish(db: sqlite3.Connection) -> None:
+            if status == PENDING:
+                # Interrupted: back to the queue unless an identical job was queued meanwhile
+                row = db.execute("SELECT key FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                if row is not None and db.execute("SELECT 1 FROM jobs WHERE key = ? AND status = ?", (row["key"], PENDING)).fetchone():
+                    db.execute("UPDATE jobs SET status = ?, finished_at = ?, error = ? WHERE id = ?", (CANCELLED, _now().isoformat(), "Duplicada", job_id))
+                    return
+                # Not a failed attempt, so it does not count towards MAX_ATTEMPTS
+                db.execute("UPDATE jobs SET status = ?, owner = NULL, heartbeat = NULL, attempts = MAX(attempts - 1, 0) WHERE id = ?", (PENDING, job_id))
+                return
+            db.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, message = ?, error = ? WHERE id = ?",
+                (status, _now().isoformat(), message, error, job_id),
+            )
+        self._transaction(_finish)
+
+    def requeue_stale(self, stale_seconds: int = STALE_SECONDS) -> int:
+        """
+        Put back running jobs orphaned by a crash (heartbeat older than `stale_seconds`).
+        Jobs that already used MAX_ATTEMPTS are failed instead. Returns how many were requeued.
+        """
+        cutoff = (_now() - timedelta(seconds=stale_seconds)).isoformat()
+
+        def _requeue(db: sqlite3.Connection) -> int:
+            rows = db.execute(
+                "SELECT id, key, attempts FROM jobs WHERE status = ? AND (heartbeat IS NULL OR heartbeat < ?)",
+                (RUNNING, cutoff),
+            ).fetchall()
+            requeued = 0
+            for row in rows:
+                duplicate = db.execute("SELECT 1 FROM jobs WHERE key = ? AND status = ?", (row["key"], PENDING)).fetchone()
+                if row["attempts"] >= MAX_ATTEMPTS or duplicate:
+                    error = "Interrumpida demasiadas veces" if not duplicate else "Duplicada"
+                    db.execute("UPDATE jobs SET status = ?, finished_at = ?, error = ? WHERE id = ?",
+                               (ERROR if not duplicate else CANCELLED, _now().isoformat(), error, row["id"]))
+                    continue
+                db.execute("UPDATE jobs SET status = ?, owner = NULL, heartbeat = NULL WHERE id = ?", (PENDING, row["id"]))
+                requeued += 1
+            return requeued
+        return self._transaction(_requeue)
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancel a pending job. Running jobs are cancelled through their scheduler."""
+        cur = self._transaction(lambda db: db.execute(
+            "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?", (CANCELLED, _now().isoformat(), job_id, PENDING)))
+        return cur.rowcount > 0
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def list_jobs(self, limit: int = 50) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(r) for r in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {r["status"]: r["n"] for r in rows}
+
+    def add_schedule(
+        self,
+        name: str,
+        at: str,
+        desde: str = "yesterday",
+        hasta: str = "yesterday",
+        target: str = "",
+        profile: str | None = None,
+        base_url: str | None = None,
+        options: Mapping[str, Any] | None = None,
+    ) -> None:
+        """Create or replace a daily schedule that queues the export at `at` (HH:MM, local time)."""
+        if not profile and not (base_url and target):
+            raise ValueError("Indique un perfil o una URL base y una carpeta destino")
+        # Fail now rather than at 2 a.m.
+        for expr in (desde, hasta):
+            resolve_day(expr)
+        try:
+            hour, minute = (int(part) for part in at.split(":"))
+            dtime(hour, minute)
+        except ValueError:
+            raise ValueError(f"Hora inválida: {at!r} (use HH:MM)")
+        next_run = _next_run(at, _now())
+        self._transaction(lambda db: db.execute(
+            "INSERT INTO schedules (name, at, desde, hasta, target, profile, base_url, options, next_run) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT(name) DO UPDATE SET at = excluded.at, desde = excluded.desde, hasta = excluded.hasta,"
+            " target = excluded.target, profile = excluded.profile, base_url = excluded.base_url,"
+            " options = excluded.options, next_run = excluded.next_run, enabled = 1",
+            (name, at, desde, hasta, target, profile, base_url, json.dumps(dict(options or {}), sort_keys=True), next_run.isoformat()),
+        ))
+
+    def delete_schedule(self, name: str) -> None:
+        self._transaction(lambda db: db.execute("DELETE FROM schedules WHERE name = ?", (name,)))
+
+    def list_schedules(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute("SELECT * FROM schedules ORDER BY name").fetchall()
+        return [dict(r) for r in rows]
+
+    def enqueue_due(self, now: datetime | None = None) -> List[int]:
+        """
+        Queue one job for every schedule whose time has come and move it to its next run.
+        Runs missed while nothing was running are caught up once, not once per missed day.
+        """
+        now = now or _now()
+
+        def _due(db: sqlite3.Connection) -> List[int]:
+            queued = []
+            rows = db.execute("SELECT * FROM schedules WHERE enabled = 1 AND next_run <= ?", (now.isoformat(),)).fetchall()
+            for row in rows:
+                desde, hasta = resolve_day(row["desde"], now.date()), resolve_day(row["hasta"], now.date())
+                job_id, _created = self._enqueue(db, desde, hasta, row["target"], row["profile"], row["base_url"], json.loads(row["options"]), row["id"])
+                queued.append(job_id)
+                db.execute("UPDATE schedules SET next_run = ?, last_run = ? WHERE id = ?", (_next_run(row["at"], now).isoformat(), now.isoformat(), row["id"]))
+            return queued
+        return self._transaction(_due)
+
+
+def cached_token(base_url: str, email: str | None = None) -> str:
+    """Access token saved by the last login of `email` (any account without it) against `base_url`."""
+    cached = load_tokens(base_url, email)
+    return cached["access"] if cached else ""
+
+
+class ExportScheduler:
+    """
+    Runs queued exports with at most `workers` at a time and queues scheduled ones when
+    due. Profile jobs have their own `profile_workers` slots, so a batch of tenants runs
+    side by side as with run_profiles_export. One background thread claims jobs from the
+    store; exports run on a thread pool.
+    `listener` receives JobEvents ("progress", "done", "error", "cancelled") from worker
+    threads, so a UI must hand them over to its own thread.
+    """
+
+    def __init__(
+        self,
+        store: JobStore | None = None,
+        workers: int | None = None,
+        listener: Optional[Callable[[JobEvent], None]] = None,
+        token_for: Callable[[str, Optional[str]], str] = cached_token,
+        poll_seconds: float = POLL_SECONDS,
+        profile_workers: int | None = None,
+    ) -> None:
+        # Imported here, like run_export in _run, to keep the store free of the export stack
+        from desktop_exporter.actions import DEFAULT_PROFILE_WORKERS
+
+        self.store = store or JobStore()
+        self.workers = max(1, workers or int(load_config().get("QUEUE_WORKERS") or DEFAULT_QUEUE_WORKERS))
+        self.profile_workers = max(1, profile_workers or DEFAULT_PROFILE_WORKERS)
+        self.listener = listener
+        self.token_for = token_for
+        self.poll_seconds = poll_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._executor = ThreadPoolExecutor(max_workers=self.workers + self.profile_workers, thread_name_prefix="queued-export")
+        self._running: Dict[int, Job] = {}
+        # Ids of the running jobs that belong to a profile
+        self._profile_jobs: Set[int] = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def active(self) -> List[int]:
+        with self._lock:
+            return list(self._running)
+
+    def _busy(self, profiles: bool) -> int:
+        with self._lock:
+            return len(self._profile_jobs) if profiles else len(self._running) - len(self._profile_jobs)
+
+    def start(self) -> "ExportScheduler":
+        self._thread = threading.Thread(target=self._loop, name="export-scheduler", daemon=True)
+        self._thread.start()
+        return self
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def enqueue(self, *args: Any, **kwargs: Any) -> Tuple[int, bool]:
+        result = self.store.enqueue(*args, **kwargs)
+        self.wake()
+        return result
+
+    def cancel(self, job_id: int) -> None:
+        if self.store.cancel(job_id):
+            self._emit(JobEvent("cancelled", Job(job_id, None)))
+            return
+        with self._lock:
+            job = self._running.get(job_id)
+        if job is not None:
+            job.cancel()
+
+    def cancel_all(self) -> None:
+        with self._lock:
+            jobs = list(self._running.values())
+        for job in jobs:
+            job.cancel()
+
+    def stop(self, timeout: float | None = 5.0) -> None:
+        """Stop claiming work; running exports are interrupted and stay queued for the next start."""
+        self._stopping.set()
+        self._wake.set()
+        self.cancel_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._executor.shutdown(wait=False)
+
+    def _emit(self, event: JobEvent) -> None:
+        if self.listener is not None:
+            try:
+                self.listener(event)
+            except Exception:
+                # A broken listener must never stop the queue
+                pass
+
+    def _loop(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                self.store.enqueue_due()
+                self.store.requeue_stale()
+                if self.active:
+                    self.store.heartbeat(self.owner)
+                for profiles, limit in ((False, self.workers), (True, self.profile_workers)):
+                    while self._busy(profiles) < limit and not self._stopping.is_set():
+                        row = self.store.claim(self.owner, profiles)
+                        if row is None:
+                            break
+                        job = Job(row["id"], None)
+                        if row["status"] == ERROR:
+                            self._emit(JobEvent("error", job, row["error"]))
+                            continue
+                        with self._lock:
+                            self._running[job.id] = job
+                            if profiles:
+                                self._profile_jobs.add(job.id)
+                        self._executor.submit(self._run, job, row)
+            except sqlite3.Error:
+                # Locked or unavailable for now; try again on the next tick
+                pass
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def _run(self, job: Job, row: Dict[str, Any]) -> None:
+        # Imported here so the store can be used without pulling in the export stack
+        from desktop_exporter.actions import run_export
+
+        def on_progress(received: int, total: Optional[int]) -> None:
+            job.check()
+            self._emit(JobEvent("progress", job, (received, total)))
+
+        try:
+            base_url, target, email = row["base_url"], row["target"], None
+            if row["profile"]:
+                profile = load_profiles().get(row["profile"])
+                if profile is None:
+                    raise ValueError(f"Perfil desconocido: {row['profile']}")
+                base_url, target = profile["base_url"], target or profile.get("target", "")
+                email = profile.get("email") or None
+            if not target:
+                raise ValueError("El trabajo no tiene carpeta destino")
+            message = run_export(base_url, self.token_for(base_url, email), row["desde"], row["hasta"], target,
+                                 on_progress=on_progress, **json.loads(row["options"]))
+        except ExportCancelled:
+            # Stopping the app leaves the job queued; an explicit cancel ends it
+            status = PENDING if self._stopping.is_set() else CANCELLED
+            self.store.finish(job.id, status)
+            self._emit(JobEvent("cancelled", job))
+        except Exception as exc:
+            error = f"{type(exc).__name__}: {exc}"
+            self.store.finish(job.id, ERROR, error=error)
+            self._emit(JobEvent("error", job, error))
+        else:
+            self.store.finish(job.id, DONE, message=message)
+            self._emit(JobEvent("done", job, message))
+        finally:
+            with self._lock:
+                self._running.pop(job.id, None)
+                self._profile_jobs.discard(job.id)
+            self.wake()
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import itertools
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+
+class ExportCancelled(Exception):
+    """Raised inside a job when it was cancelled while running."""
+
+
+class JobEvent(NamedTuple):
+    # kind is one of: "progress", "done", "error", "cancelled"
+    kind: str
+    job: "Job"
+    payload: Any = None
+
+
+Listener = Callable[[JobEvent], None]
+
+
+class Job:
+    def __init__(self, job_id: int, listener: Optional[Listener]) -> None:
+        self.id = job_id
+        self.listener = listener
+        self.future: Optional[Future] = None
+        self._cancel = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def cancel(self) -> None:
+        """Cancel a pending job outright, or ask a running one to stop at its next progress tick."""
+        self._cancel.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    def check(self) -> None:
+        if self._cancel.is_set():
+            raise ExportCancelled("Exportación cancelada")
+
+
+class JobRunner:
+    """
+    Run blocking work (login, exports) on worker threads and hand the results back to the
+    Tk thread. Workers only ever put events on a queue; when a widget is given, the runner
+    drains that queue from `widget.after()` so listeners always run on the UI thread.
+    Without a widget, callers drain events themselves with `poll()`.
+    """
+
+    def __init__(self, widget: Any = None, max_workers: int = 1, interval_ms: int = 100) -> None:
+        self.widget = widget
+        self.interval_ms = interval_ms
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="export-job")
+        self._events: "queue.Queue[JobEvent]" = queue.Queue()
+        self._jobs: Dict[int, Job] = {}
+        self._ids = itertools.count(1)
+        self._pumping = False
+
+    def submit(
+        self,
+        fn: Callable[..., Any],
+        *args: Any,
+        listener: Optional[Listener] = None,
+        with_progress: bool = False,
+        **kwargs: Any,
+    ) -> Job:
+        """
+        Queue `fn(*args, **kwargs)`. With `with_progress=True` an `on_progress(received, total)`
+        keyword is injected that forwards progress events and aborts the job once cancelled.
+        """
+        job = Job(next(self._ids), listener)
+        if with_progress:
+            def on_progress(received: int, total: Optional[int]) -> None:
+                job.check()
+                self._events.put(JobEvent("progress", job, (received, total)))
+            kwargs["on_progress"] = on_progress
+        self._jobs[job.id] = job
+        job.future = self._executor.submit(self._run, job, fn, args, kwargs)
+
+        def _on_future_done(fut: Future) -> None:
+            # A job cancelled while still queued never reaches _run
+            if fut.cancelled():
+                self._events.put(JobEvent("cancelled", job))
+
+        job.future.add_done_callback(_on_future_done)
+        self._start_pump()
+        return job
+
+    def _run(self, job: Job, fn: Callable[..., Any], args: tuple, kwargs: Dict[str, Any]) -> None:
+        try:
+            job.check()
+            result = fn(*args, **kwargs)
+        except ExportCancelled:
+            self._events.put(JobEvent("cancelled", job))
+        except Exception as exc:
+            self._events.put(JobEvent("error", job, exc))
+        else:
+            self._events.put(JobEvent("done", job, result))
+
+    @property
+    def active(self) -> List[Job]:
+        return list(self._jobs.values())
+
+    def cancel_all(self) -> None:
+        for job in self.active:
+            job.cancel()
+
+    def poll(self) -> List[JobEvent]:
+        """Drain pending events and dispatch them to their job listeners."""
+        events: List[JobEvent] = []
+        while True:
+            try:
+                event = self._events.get_nowait()
+            except queue.Empty:
+                break
+            if event.kind != "progress":
+                self._jobs.pop(event.job.id, None)
+            if event.job.listener is not None:
+                event.job.listener(event)
+            events.append(event)
+        return events
+
+    def _start_pump(self) -> None:
+        if self.widget is None or self._pumping:
+            return
+        self._pumping = True
+        self.widget.after(self.interval_ms, self._tick)
+
+    def _tick(self) -> None:
+        try:
+            self.poll()
+        finally:
+            if self._jobs or not self._events.empty():
+                try:
+                    self.widget.after(self.interval_ms, self._tick)
+                except Exception:
+                    # Widget destroyed; nothing left to report to
+                    self._pumping = False
+            else:
+                self._pumping = False
+
+    def shutdown(self) -> None:
+        self.cancel_all()
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Tuple
+
+from desktop_exporter.api import ProgressCallback
+from desktop_exporter.dbfio import DBFWriter, Field
+
+
+# Column spec: DBF name, type, length, decimals, source key in the factura JSON.
+# Dotted keys reach into nested objects; a leading "^" on a line column reads the parent factura.
+# Override with "DBF_LAYOUT" in the config file to match the tables export_dbf produces.
+DEFAULT_LAYOUT: Dict[str, Any] = {
+    "lines_key": "items",
+    "movimcab": [
+        ["NUMERO", "C", 15, 0, "numero"],
+        ["FECHA", "D", 8, 0, "fecha"],
+        ["RUC", "C", 15, 0, "cliente.ruc"],
+        ["CLIENTE", "C", 60, 0, "cliente.nombre"],
+        ["CONDICION", "C", 10, 0, "condicion"],
+        ["IVA5", "N", 15, 2, "iva_5"],
+        ["IVA10", "N", 15, 2, "iva_10"],
+        ["TOTAL", "N", 15, 2, "total"],
+    ],
+    "movimite": [
+        ["NUMERO", "C", 15, 0, "^numero"],
+        ["FECHA", "D", 8, 0, "^fecha"],
+        ["CODIGO", "C", 20, 0, "codigo"],
+        ["DESCRIP", "C", 60, 0, "descripcion"],
+        ["CANTIDAD", "N", 12, 3, "cantidad"],
+        ["PRECIO", "N", 15, 2, "precio_unitario"],
+        ["IVA", "N", 5, 0, "iva"],
+        ["SUBTOTAL", "N", 15, 2, "subtotal"],
+    ],
+}
+
+Getter = Callable[[Mapping[str, Any], Mapping[str, Any]], Any]
+
+
+def _getter(source: str) -> Getter:
+    from_parent = source.startswith("^")
+    keys = source.lstrip("^").split(".")
+
+    def get(record: Mapping[str, Any], parent: Mapping[str, Any]) -> Any:
+        value: Any = parent if from_parent else record
+        for key in keys:
+            if not isinstance(value, Mapping):
+                return None
+            value = value.get(key)
+        return value
+    return get
+
+
+def _compile(columns: List[List[Any]]) -> Tuple[List[Field], List[Getter]]:
+    fields = [Field(name, ftype, int(length), int(decimals)) for name, ftype, length, decimals, _src in columns]
+    getters = [_getter(src) for *_spec, src in columns]
+    return fields, getters
+
+
+def write_facturas(
+    facturas: Iterable[Mapping[str, Any]],
+    target_dir: Path,
+    layout: Mapping[str, Any] | None = None,
+    on_progress: ProgressCallback | None = None,
+) -> Tuple[int, int]:
+    """
+    Write movimcab.dbf (one row per factura) and movimite.dbf (one row per line) into
+    `target_dir` straight from the API records. `facturas` may be any iterable, so a
+    streaming source keeps memory flat. Returns (header rows, line rows).
+    """
+    layout = layout or DEFAULT_LAYOUT
+    lines_key = layout.get("lines_key", "items")
+    cab_fields, cab_getters = _compile(layout["movimcab"])
+    ite_fields, ite_getters = _compile(layout["movimite"])
+    target_dir = Path(target_dir)
+    target_dir.mkdir(parents=True, exist_ok=True)
+
+    with DBFWriter(target_dir / "movimcab.dbf", cab_fields) as cab, DBFWriter(target_dir / "movimite.dbf", ite_fields) as ite:
+        for factura in facturas:
+            cab.append([get(factura, factura) for get in cab_getters])
+            for line in factura.get(lines_key) or ():
+                ite.append([get(line, factura) for get in ite_getters])
+            if on_progress is not None and cab.count % 500 == 0:
+                on_progress(cab.bytes_written + ite.bytes_written, None)
+    return cab.count, ite.count
@@ -1,31 +1,78 @@
 from __future__ import annotations
 
+import time
+
+# Taken before any heavy import so --startup-timing can report import cost
+_T_START = time.perf_counter()
+
+import json
 import os
 import sys
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import ttkbootstrap as tb
-from ttkbootstrap.constants import PRIMARY, SUCCESS, INFO, DANGER
-from ttkbootstrap.widgets import DateEntry
 from pathlib import Path
 from datetime import date
-from PIL import Image, ImageTk
 
-from desktop_exporter.api import AjaxAPI
-from desktop_exporter.config import load_config, save_config
-from desktop_exporter.ui.login import LoginDialog
+_T_TK = time.perf_counter()
+# App subclasses tb.Window, so this cannot wait; ttkbootstrap loads PIL and
+# ttkbootstrap.widgets (DateEntry) along with it, and --startup-timing reports that cost
+import ttkbootstrap as tb
+from ttkbootstrap.constants import PRIMARY, SUCCESS, INFO, DANGER
+_T_TTKBOOTSTRAP = time.perf_counter()
+
+from desktop_exporter.config import _config_path, load_config, save_config
+from desktop_exporter.credentials import load_tokens
+from desktop_exporter.jobs import JobRunner
 from desktop_exporter.ui.settings import open_settings as open_settings_dialog
-from desktop_exporter.ui.dashboard import Dashboard
 
+_T_IMPORTS = time.perf_counter()
 
+# requests (via api), the job queue and the dashboard load on first use, after login.
 # run_export and LoginDialog moved to actions.py and ui/login.py
 
+# Modules whose presence before the first paint --startup-timing reports
+STARTUP_HEAVY_MODULES = ("PIL", "ttkbootstrap.widgets", "requests", "sqlite3")
+
+# Logo pre-scaled to the 100 px login height; Tk decodes PNG natively, so drawing it needs
+# no PIL work (PIL itself is still imported by ttkbootstrap)
+LOGO_FILE = "logo_100.png"
+STARTUP_BUDGET_MS = float(os.getenv("DESKTOP_EXPORTER_STARTUP_BUDGET_MS", "1500"))
+
+
+def _resource_dir() -> Path:
+    # PyInstaller --onefile unpacks --add-data files under sys._MEIPASS
+    return Path(getattr(sys, "_MEIPASS", Path(__file__).resolve().parent))
+
+
+def _load_logo(master) -> tk.PhotoImage:
+    resources = _resource_dir()
+    prerendered = resources / LOGO_FILE
+    if prerendered.exists():
+        return tk.PhotoImage(master=master, file=str(prerendered))
+    # Fallback for trees without the pre-rendered asset: scale once with PIL
+    from PIL import Image, ImageTk
+    img = Image.open(resources / "logo.png")
+    base_h = 100
+    w, h = img.size
+    scale = base_h / float(h)
+    new_w = max(100, int(w * scale))
+    return ImageTk.PhotoImage(img.resize((new_w, base_h), Image.LANCZOS), master=master)
+
+
+def _login(base_url: str, email: str, password: str) -> str:
+    # Runs on the job thread, so importing requests never delays the window
+    from desktop_exporter.api import AjaxAPI
+    with AjaxAPI(base_url=base_url) as api:
+        return api.login(email, password)
+
 
 class App(tb.Window):
     def __init__(self) -> None:
         super().__init__(themename="flatly")
         self.title("Desktop Exporter")
         self.geometry("700x340")
+        # Login and other network calls run off the Tk thread
+        self.jobs = JobRunner(self, max_workers=1)
 
         main = tb.Frame(self, padding=0)
         main.pack(fill=tk.BOTH, expand=True)
@@ -43,6 +90,11 @@ class App(tb.Window):
         default_base = os.getenv("AJAX_API_BASE", "https://ajax-erp-2c56bc9ad64c.herokuapp.com")
         self.var_base = tk.StringVar(value=str(cfg.get("AJAX_API_BASE", default_base)))
         self.var_token = tk.StringVar(value=os.getenv("AJAX_API_TOKEN", ""))
+        # Reuse the session cached by a previous launch; the API client refreshes it as needed
+        cached = load_tokens(self.var_base.get().strip())
+        if cached and not self.var_token.get():
+            self.var_token.set(cached["access"])
+            self.var_user_email.set(cached.get("email", ""))
         self.var_desde = tk.StringVar(value=str(date.today()))
         self.var_hasta = tk.StringVar(value=str(date.today()))
         # Default to Windows E:\ if present
@@ -76,17 +128,9 @@ class App(tb.Window):
         login_inner.columnconfigure(1, weight=1, minsize=560)
         login_inner.rowconfigure(0, weight=1)
 
-        # Left: logo (scaled to reasonable height)
+        # Left: logo (pre-scaled to ~100 px height)
         try:
-            logo_path = str(Path(__file__).resolve().parent / "logo.png")
-            img = Image.open(logo_path)
-            # scale to height ~100 keeping aspect ratio (larger logo)
-            base_h = 100
-            w, h = img.size
-            scale = base_h / float(h)
-            new_w = max(100, int(w * scale))
-            img = img.resize((new_w, base_h), Image.LANCZOS)
-            self.logo_img = ImageTk.PhotoImage(img)
+            self.logo_img = _load_logo(self)
             # Draw blue background full size and center the image
             def _place_logo(event=None):
                 logo_col.delete("all")
@@ -118,37 +162,63 @@ class App(tb.Window):
         tb.Button(form_inner, text="Entrar", bootstyle=PRIMARY, command=self.do_center_login).grid(row=4, column=0, sticky=tk.W, pady=(8,0))
         form_inner.columnconfigure(0, weight=0)
         row += 1
-        # Form panel (hidden when not authenticated)
-        self.form_frame = Dashboard(main, self.var_base, self.var_token, self.var_target, self.pick_dir)
-        self.form_frame.grid(row=row, column=0, columnspan=2, sticky=tk.NSEW)
+        # Form panel, built on first login (hidden when not authenticated)
+        self.form_row = row
+        self.form_frame = None
 
         main.columnconfigure(1, weight=1)
 
         # Secret shortcut: F1 opens settings dialog
         self.bind('<F1>', self.open_settings)
 
-        # Initialize UI based on auth state (hide everything except centered login when not authenticated)
-        self.update_auth_ui()
+        # Initialize UI based on auth state (hide everything except centered login when not authenticated).
+        # A restored session paints the window first and builds the dashboard right after
+        self.update_auth_ui(defer_dashboard=True)
 
     def pick_dir(self) -> None:
         path = filedialog.askdirectory(initialdir=self.var_target.get() or "E:\\")
         if path:
             self.var_target.set(path)
 
+    def _ensure_dashboard(self) -> None:
+        if self.form_frame is not None:
+            return
+        from desktop_exporter.ui.dashboard import Dashboard
+        self.form_frame = Dashboard(self.main, self.var_base, self.var_token, self.var_target, self.pick_dir)
+        self.form_frame.grid(row=self.form_row, column=0, columnspan=2, sticky=tk.NSEW)
+
+    def _build_after_paint(self) -> None:
+        # The dashboard pulls in requests, the job queue and sqlite. The first Expose queues
+        # the window's redraw as idle work, so building from after_idle there comes after it
+        def on_expose(_event) -> None:
+            self.main.unbind("<Expose>", bind_id)
+            self.after_idle(self._show_dashboard)
+        bind_id = self.main.bind("<Expose>", on_expose, add="+")
+
+    def _show_dashboard(self) -> None:
+        if self.form_frame is None and self.var_token.get():
+            self.update_auth_ui()
+
     def open_login(self) -> None:
+        from desktop_exporter.ui.login import LoginDialog
         dlg = LoginDialog(self, self.var_base, self.var_token, self.var_user_email)
         self.wait_window(dlg)
         if self.var_token.get():
             self.update_auth_ui()
 
     def do_center_login(self) -> None:
-        try:
-            api = AjaxAPI(base_url=self.var_base.get().strip())
-            access = api.login(self.login_email_var.get().strip(), self.login_password_var.get().strip())
-            self.var_token.set(access)
-            self.var_user_email.set(self.login_email_var.get().strip())
+        email = self.login_email_var.get().strip()
+        password = self.login_password_var.get().strip()
+        base = self.var_base.get().strip()
+        self.jobs.submit(_login, base, email, password, listener=lambda event: self._on_login_event(event, email))
+
+    def _on_login_event(self, event, email: str) -> None:
+        if event.kind == "done":
+            self.var_token.set(event.payload)
+            self.var_user_email.set(email)
             self.update_auth_ui()
-        except Exception as exc:
+        elif event.kind == "error":
+            exc = event.payload
             try:
                 self.clipboard_clear()
                 self.clipboard_append(str(exc))
@@ -157,9 +227,20 @@ class App(tb.Window):
                 pass
             messagebox.showerror("Login", str(exc))
 
-    def update_auth_ui(self) -> None:
+    def _switch_profile(self, profile) -> None:
+        # Each profile talks to its own Ajax instance; use the cached login of its account, if any
+        cached = load_tokens(profile["base_url"], profile.get("email") or None)
+        self.var_token.set(cached["access"] if cached else "")
+        self.var_user_email.set((cached or {}).get("email") or profile.get("email", ""))
+        self.update_auth_ui()
+
+    def update_auth_ui(self, defer_dashboard: bool = False) -> None:
         authed = bool(self.var_token.get())
         if authed:
+            if defer_dashboard and self.form_frame is None:
+                self._build_after_paint()
+            else:
+                self._ensure_dashboard()
             # hide central login, show form, show email top-right
             try:
                 self.center_login.grid_remove()
@@ -184,10 +265,8 @@ class App(tb.Window):
         else:
             # show central login, hide form and header email
             self.center_login.grid()
-            try:
+            if self.form_frame is not None:
                 self.form_frame.grid_remove()
-            except Exception:
-                pass
             try:
                 self.user_label.grid_forget()
             except Exception:
@@ -199,7 +278,7 @@ class App(tb.Window):
                 pass
 
     def open_settings(self, event=None) -> None:
-        open_settings_dialog(self, self.var_base)
+        open_settings_dialog(self, self.var_base, self.var_target, self.var_user_email, on_profile=self._switch_profile)
         # Persist the new base URL after closing settings
         cfg = load_config()
         cfg["AJAX_API_BASE"] = self.var_base.get().strip()
@@ -231,8 +310,42 @@ class App(tb.Window):
             messagebox.showerror("Error", str(exc))
 
 
+def _report_startup(app: App) -> None:
+    """Print import/first-paint timings, save them next to the config file and quit."""
+    loaded = [name for name in STARTUP_HEAVY_MODULES if name in sys.modules]
+    app.update_idletasks()
+    app.update()
+    t_paint = time.perf_counter()
+    timings = {
+        "imports_ms": round((_T_IMPORTS - _T_START) * 1000, 1),
+        # Part of imports_ms; includes PIL and the ttkbootstrap widgets
+        "ttkbootstrap_ms": round((_T_TTKBOOTSTRAP - _T_TK) * 1000, 1),
+        "loaded_before_paint": loaded,
+        "window_ms": round((app._t_window - _T_IMPORTS) * 1000, 1),
+        "first_paint_ms": round((t_paint - _T_START) * 1000, 1),
+        "budget_ms": STARTUP_BUDGET_MS,
+    }
+    timings["within_budget"] = timings["first_paint_ms"] <= STARTUP_BUDGET_MS
+    line = json.dumps(timings)
+    if sys.stdout is not None:
+        print(line)
+    try:
+        with _config_path().with_name(".desktop_exporter_startup.jsonl").open("a", encoding="utf-8") as fh:
+            fh.write(line + "\n")
+    except OSError:
+        pass
+    app.exit_code = 0 if timings["within_budget"] else 1
+    app.destroy()
+
+
 if __name__ == "__main__":
     app = App()
+    app._t_window = time.perf_counter()
+    if "--startup-timing" in sys.argv[1:]:
+        app.exit_code = 0
+        app.after_idle(lambda: _report_startup(app))
+        app.mainloop()
+        sys.exit(app.exit_code)
     app.mainloop()
 
 
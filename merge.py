@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import mmap
+import shutil
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Sequence, Set
+
+from desktop_exporter.dbfio import EOF_MARKER, DBFHeader, FieldSlot, find_table, read_fields, read_header, record_key, write_header
+
+
+# How the new range is folded into the existing tables. The header table is upserted by
+# key and rows inside the exported date range that no longer exist are deleted; the line
+# table is replaced per header key. Override with "DBF_MERGE" in the config file.
+DEFAULT_MERGE: Dict[str, Dict[str, Any]] = {
+    "movimcab": {"key": ["NUMERO"], "date": "FECHA"},
+    "movimite": {"key": ["NUMERO"], "parent": "movimcab"},
+}
+
+
+class _Table:
+    """Header and field slots of one DBF, with access to its raw records."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        with path.open("rb") as fh:
+            self.header: DBFHeader = read_header(fh)
+            fh.seek(0)
+            self.raw_head = fh.read(self.header.header_length)
+        self.fields = {f.name: f for f in read_fields(self.header)}
+
+    def slots(self, names: Sequence[str]) -> List[FieldSlot]:
+        missing = [n for n in names if n.upper() not in self.fields]
+        if missing:
+            raise ValueError(f"{self.path.name}: campos inexistentes {', '.join(missing)}")
+        return [self.fields[n.upper()] for n in names]
+
+    def records(self) -> List[bytes]:
+        """All live (not deleted) records; only used for the new range, which is small."""
+        rec_len, start = self.header.record_length, self.header.header_length
+        with self.path.open("rb") as fh:
+            fh.seek(start)
+            data = fh.read(rec_len * self.header.record_count)
+        return [data[i:i + rec_len] for i in range(0, len(data), rec_len) if data[i:i + 1] != b"*"]
+
+
+def _index_existing(table: _Table, slots: Sequence[FieldSlot]) -> Dict[bytes, List[int]]:
+    """Key -> record numbers (0-based) of live records, built with one pass over the file."""
+    index: Dict[bytes, List[int]] = {}
+    if not table.header.record_count:
+        return index
+    rec_len, start = table.header.record_length, table.header.header_length
+    with table.path.open("rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for i in range(table.header.record_count):
+            pos = start + i * rec_len
+            if mm[pos:pos + 1] == b"*":
+                continue
+            index.setdefault(record_key(mm[pos:pos + rec_len], slots), []).append(i)
+    return index
+
+
+def _apply(table: _Table, overwrite: Mapping[int, bytes], delete: Set[int], append: Sequence[bytes]) -> None:
+    """
+    Write the changes in place: new records first (past the current end), then the header
+    count, then overwrites and deletion flags, so an interrupted run never leaves the
+    header pointing at missing records.
+    """
+    rec_len, start = table.header.record_length, table.header.header_length
+    count = table.header.record_count
+    with table.path.open("r+b") as fh:
+        if append:
+            fh.seek(start + count * rec_len)
+            fh.write(b"".join(append))
+            fh.write(EOF_MARKER)
+            fh.truncate()
+            write_header(fh, table.raw_head, count + len(append))
+        for recno, record in overwrite.items():
+            fh.seek(start + recno * rec_len)
+            fh.write(record)
+        for recno in delete:
+            fh.seek(start + recno * rec_len)
+            fh.write(b"*")
+
+
+def _check_layout(existing: _Table, new: _Table) -> None:
+    if existing.header.descriptors != new.header.descriptors or existing.header.record_length != new.header.record_length:
+        raise ValueError(f"{existing.path.name}: la estructura del DBF exportado no coincide con la existente")
+
+
+def merge_into(new_dir: Path, target: Path, desde_iso: str, hasta_iso: str, spec: Mapping[str, Mapping[str, Any]] | None = None) -> Dict[str, Dict[str, int]]:
+    """
+    Fold the tables exported for [desde, hasta] in `new_dir` into the tables in `target`.
+    Tables missing from `target` are copied as they are. Returns per-table counts of
+    inserted, updated, deleted and unchanged records.
+    """
+    spec = spec or DEFAULT_MERGE
+    summary: Dict[str, Dict[str, int]] = {}
+    # Header keys touched by this range (upserted or deleted), per header table stem
+    touched: Dict[str, Set[bytes]] = {}
+    date_lo, date_hi = desde_iso.replace("-", "").encode(), hasta_iso.replace("-", "").encode()
+
+    # Header tables first so line tables know which keys were touched
+    ordered = sorted(spec.items(), key=lambda item: bool(item[1].get("parent")))
+    for stem, options in ordered:
+        new_path = find_table(new_dir, stem)
+        if new_path is None:
+            continue
+        existing_path = find_table(target, stem)
+        new = _Table(new_path)
+        if existing_path is None:
+            shutil.copyfile(new_path, target / new_path.name)
+            summary[new_path.name] = {"inserted": len(new.records()), "updated": 0, "deleted": 0, "unchanged": 0}
+            continue
+        existing = _Table(existing_path)
+        _check_layout(existing, new)
+        slots = existing.slots(options["key"])
+        index = _index_existing(existing, slots)
+        new_records = new.records()
+        counts = {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+        overwrite: Dict[int, bytes] = {}
+        delete: Set[int] = set()
+        append: List[bytes] = []
+
+        parent = options.get("parent")
+        if parent:
+            # Line table: the lines of each touched header are replaced as a group, unless
+            # they are byte-for-byte what is already there
+            groups: Dict[bytes, List[bytes]] = {}
+            for record in new_records:
+                groups.setdefault(record_key(record, slots), []).append(record)
+            rec_len, start = existing.header.record_length, existing.header.header_length
+            with existing.path.open("rb") as fh:
+                # New groups first, in file order, then headers that lost all their lines
+                for key in list(groups) + [k for k in touched.get(parent, set()) if k not in groups]:
+                    old_recnos = index.get(key, [])
+                    lines = groups.get(key, [])
+                    current = []
+                    for recno in old_recnos:
+                        fh.seek(start + recno * rec_len)
+                        current.append(fh.read(rec_len))
+                    if current == lines:
+                        counts["unchanged"] += len(lines)
+                        continue
+                    delete.update(old_recnos)
+                    append.extend(lines)
+            counts["deleted"] = len(delete)
+            counts["inserted"] = len(append)
+        else:
+            new_keys: Set[bytes] = set()
+            with existing.path.open("rb") as fh:
+                for record in new_records:
+                    key = record_key(record, slots)
+                    new_keys.add(key)
+                    matches = index.get(key)
+                    if not matches:
+                        append.append(record)
+                        counts["inserted"] += 1
+                        continue
+                    fh.seek(existing.header.header_length + matches[0] * existing.header.record_length)
+                    if fh.read(existing.header.record_length) == record:
+                        counts["unchanged"] += 1
+                    else:
+                        overwrite[matches[0]] = record
+                        counts["updated"] += 1
+                    # Duplicate keys in the old table collapse onto the first one
+                    delete.update(matches[1:])
+                date_field = options.get("date")
+                removed: Set[bytes] = set()
+                if date_field:
+                    date_slot = existing.slots([date_field])[0]
+                    for key, recnos in index.items():
+                        if key in new_keys:
+                            continue
+                        fh.seek(existing.header.header_length + recnos[0] * existing.header.record_length + date_slot.offset)
+                        if date_lo <= fh.read(date_slot.length) <= date_hi:
+                            delete.update(recnos)
+                            removed.add(key)
+            counts["deleted"] = len(delete)
+            touched[stem] = new_keys | removed
+
+        _apply(existing, overwrite, delete, append)
+        summary[existing.path.name] = counts
+    return summary
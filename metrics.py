@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from typing import Any, Callable, Collection, Dict, Iterator, List
+
+from desktop_exporter.config import _config_path
+
+
+# Rotating JSON-lines log kept next to the config file
+METRICS_MAX_BYTES = 1024 * 1024
+METRICS_BACKUPS = 3
+
+MetricsHook = Callable[[Dict[str, Any]], None]
+_hooks: List[MetricsHook] = []
+_logger: logging.Logger | None = None
+_logger_lock = threading.Lock()
+
+
+def _metrics_path() -> Path:
+    return _config_path().with_name(".desktop_exporter_metrics.jsonl")
+
+
+def add_metrics_hook(hook: MetricsHook) -> None:
+    """Register a callable that receives every finished export record (e.g. to push to a collector)."""
+    _hooks.append(hook)
+
+
+def remove_metrics_hook(hook: MetricsHook) -> None:
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+
+def _get_logger() -> logging.Logger:
+    global _logger
+    with _logger_lock:
+        if _logger is None:
+            logger = logging.getLogger("desktop_exporter.metrics")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            try:
+                handler = RotatingFileHandler(_metrics_path(), maxBytes=METRICS_MAX_BYTES, backupCount=METRICS_BACKUPS, encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                logger.addHandler(handler)
+            except OSError:
+                # Unwritable home directory; metrics still reach the hooks
+                logger.addHandler(logging.NullHandler())
+            _logger = logger
+        return _logger
+
+
+def recent_records(kinds: Collection[str] = (), base_url: str | None = None, limit: int = 50) -> List[Dict[str, Any]]:
+    """Newest finished ("ok") records from the current log file, optionally filtered, oldest first."""
+    try:
+        with _metrics_path().open("r", encoding="utf-8") as fh:
+            lines = fh.readlines()
+    except OSError:
+        return []
+    # Callers pass the base URL with or without the trailing slash
+    base_url = base_url.rstrip("/") if base_url is not None else None
+    records: List[Dict[str, Any]] = []
+    for line in reversed(lines):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if record.get("status") != "ok" or (kinds and record.get("kind") not in kinds):
+            continue
+        if base_url is not None and (record.get("base_url") or "").rstrip("/") != base_url:
+            continue
+        records.append(record)
+        if len(records) >= limit:
+            break
+    return records[::-1]
+
+
+class ExportMetrics:
+    """
+    Per-export measurements shared by AjaxAPI and actions. Phase durations are summed
+    across worker threads, so with chunked exports they can exceed the wall time.
+    """
+
+    def __init__(self, kind: str, **context: Any) -> None:
+        self.kind = kind
+        self.context = context
+        self.phases: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self.response_times: List[float] = []
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+
+    def add_phase(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - started)
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record_response(self, resp: Any) -> None:
+        """Server response time (until headers) and urllib3 retries for one request."""
+        retries = getattr(getattr(getattr(resp, "raw", None), "retries", None), "history", ()) or ()
+        with self._lock:
+            self.response_times.append(resp.elapsed.total_seconds())
+            self.counters["requests"] = self.counters.get("requests", 0) + 1
+            if retries:
+                self.counters["retries"] = self.counters.get("retries", 0) + len(retries)
+
+    def as_record(self, status: str, error: str | None = None) -> Dict[str, Any]:
+        with self._lock:
+            times = sorted(self.response_times)
+            record: Dict[str, Any] = {
+                "ts": datetime.now().isoformat(timespec="seconds"),
+                "kind": self.kind,
+                "status": status,
+                "wall_seconds": round(time.perf_counter() - self._started, 4),
+                "phases": {name: round(sec, 4) for name, sec in self.phases.items()},
+                "counters": dict(self.counters),
+                **self.context,
+            }
+        if times:
+            record["response_seconds"] = {
+                "min": round(times[0], 4),
+                "median": round(times[len(times) // 2], 4),
+                "max": round(times[-1], 4),
+            }
+        if error:
+            record["error"] = error
+        return record
+
+    def emit(self, status: str, error: str | None = None) -> Dict[str, Any]:
+        record = self.as_record(status, error)
+        _get_logger().info(json.dumps(record, ensure_ascii=False))
+        for hook in list(_hooks):
+            try:
+                hook(record)
+            except Exception:
+                # A broken hook must never fail the export
+                pass
+        return record
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import mmap
+import struct
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Sequence, Tuple
+
+from desktop_exporter.dbfio import EOF_MARKER, FieldSlot, find_table, read_fields, read_header, record_key, write_header
+from desktop_exporter.extract import publish, staging_dir
+
+
+# Per table: fields to physically sort by (after packing out deleted rows), and index
+# files to build as {file stem: [key fields]}. Override with "DBF_OPTIMIZE" in the config.
+DEFAULT_OPTIMIZE: Dict[str, Dict[str, Any]] = {
+    "movimcab": {"sort": ["NUMERO"], "indexes": {"cabnum": ["NUMERO"], "cabfec": ["FECHA", "NUMERO"]}},
+    "movimite": {"sort": ["NUMERO"], "indexes": {"itenum": ["NUMERO"]}},
+}
+
+IDX_PAGE = 512
+IDX_KEY_AREA = 500
+IDX_ROOT, IDX_LEAF = 1, 2
+
+
+def _key_slots(fields: Sequence[FieldSlot], names: Sequence[str]) -> List[FieldSlot]:
+    by_name = {f.name: f for f in fields}
+    missing = [n for n in names if n.upper() not in by_name]
+    if missing:
+        raise ValueError(f"Campos inexistentes para la clave: {', '.join(missing)}")
+    slots = [by_name[n.upper()] for n in names]
+    for slot in slots:
+        if slot.type not in "CDN":
+            raise ValueError(f"Tipo de campo no indexable: {slot.name} ({slot.type})")
+    return slots
+
+
+def _key_expression(slots: Sequence[FieldSlot]) -> str:
+    # Character expressions whose value is exactly the stored bytes, so byte order is index order
+    parts = []
+    for slot in slots:
+        if slot.type == "D":
+            parts.append(f"DTOS({slot.name})")
+        elif slot.type == "N":
+            parts.append(f"STR({slot.name},{slot.length},{slot.decimals})")
+        else:
+            parts.append(slot.name)
+    return "+".join(parts)
+
+
+def pack_and_sort(src: Path, dest: Path, sort_fields: Sequence[str] = ()) -> Tuple[int, int]:
+    """
+    Copy `src` to `dest` without deleted records, ordered by `sort_fields` (stable, so
+    lines keep their original order within an invoice). Only the keys are held in memory;
+    records are read through mmap. Returns (records kept, records dropped).
+    """
+    with src.open("rb") as fh:
+        header = read_header(fh)
+        fh.seek(0)
+        raw_head = fh.read(header.header_length)
+        slots = _key_slots(read_fields(header), sort_fields) if sort_fields else []
+        rec_len, start, count = header.record_length, header.header_length, header.record_count
+        with dest.open("wb") as out:
+            write_header(out, raw_head, 0)
+            if count == 0:
+                out.write(EOF_MARKER)
+                return 0, 0
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                order: List[Tuple[bytes, int]] = []
+                for i in range(count):
+                    pos = start + i * rec_len
+                    if mm[pos:pos + 1] == b"*":
+                        continue
+                    key = record_key(mm[pos:pos + rec_len], slots) if slots else b""
+                    order.append((key, i))
+                if slots:
+                    order.sort(key=lambda item: item[0])
+                for _key, i in order:
+                    pos = start + i * rec_len
+                    out.write(mm[pos:pos + rec_len])
+            out.write(EOF_MARKER)
+            write_header(out, raw_head, len(order))
+    return len(order), count - len(order)
+
+
+def write_idx(table: Path, key_fields: Sequence[str], idx_path: Path) -> int:
+    """
+    Build an uncompressed FoxPro .IDX for `key_fields` (keys concatenated as one character
+    expression). The B-tree is built bottom-up from the sorted keys. Returns the key count.
+    """
+    with table.open("rb") as fh:
+        header = read_header(fh)
+        slots = _key_slots(read_fields(header), key_fields)
+        rec_len, start = header.record_length, header.header_length
+        entries: List[Tuple[bytes, int]] = []
+        if header.record_count:
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for i in range(header.record_count):
+                    pos = start + i * rec_len
+                    if mm[pos:pos + 1] == b"*":
+                        continue
+                    entries.append((record_key(mm[pos:pos + rec_len], slots), i + 1))
+    entries.sort()
+
+    key_len = sum(s.length for s in slots)
+    per_node = IDX_KEY_AREA // (key_len + 4)
+    if per_node < 2:
+        raise ValueError("Clave demasiado larga para un índice IDX")
+
+    nodes: List[bytearray] = []
+
+    def _build_level(items: List[Tuple[bytes, int]], leaf: bool) -> List[Tuple[bytes, int]]:
+        # Returns (highest key, node offset) for each node written on this level
+        groups = [items[i:i + per_node] for i in range(0, len(items), per_node)] or [[]]
+        first_index = len(nodes)
+        parents = []
+        for n, group in enumerate(groups):
+            offset = IDX_PAGE * (1 + first_index + n)
+            left = offset - IDX_PAGE if n > 0 else -1
+            right = offset + IDX_PAGE if n < len(groups) - 1 else -1
+            node = bytearray(IDX_PAGE)
+            struct.pack_into("<HHii", node, 0, IDX_LEAF if leaf else 0, len(group), left, right)
+            pos = 12
+            for key, pointer in group:
+                node[pos:pos + key_len] = key
+                # Record numbers and child pointers are stored most significant byte first
+                struct.pack_into(">I", node, pos + key_len, pointer)
+                pos += key_len + 4
+            nodes.append(node)
+            parents.append((group[-1][0] if group else b" " * key_len, offset))
+        return parents
+
+    level = _build_level(entries, leaf=True)
+    while len(level) > 1:
+        level = _build_level(level, leaf=False)
+    root_offset = level[0][1]
+    root = nodes[root_offset // IDX_PAGE - 1]
+    struct.pack_into("<H", root, 0, struct.unpack_from("<H", root, 0)[0] | IDX_ROOT)
+
+    head = bytearray(IDX_PAGE)
+    struct.pack_into("<iiiH", head, 0, root_offset, -1, IDX_PAGE * (1 + len(nodes)), key_len)
+    expression = _key_expression(slots).encode("ascii")
+    head[16:16 + len(expression)] = expression
+    with idx_path.open("wb") as out:
+        out.write(head)
+        for node in nodes:
+            out.write(node)
+    return len(entries)
+
+
+def optimize_tables(target: Path, spec: Mapping[str, Mapping[str, Any]] | None = None) -> Dict[str, Any]:
+    """
+    Post-export stage: pack and sort each configured table and build its .IDX files in a
+    staging directory, then swap everything into `target` atomically. Tables that are not
+    present are skipped. Returns a summary with kept/dropped counts and the index files.
+    """
+    spec = spec or DEFAULT_OPTIMIZE
+    summary: Dict[str, Any] = {}
+    with staging_dir(target) as staging:
+        for stem, options in spec.items():
+            table = find_table(target, stem)
+            if table is None:
+                continue
+            staged = staging / table.name
+            kept, dropped = pack_and_sort(table, staged, options.get("sort") or ())
+            indexes = []
+            for idx_stem, fields in (options.get("indexes") or {}).items():
+                write_idx(staged, fields, staging / f"{idx_stem}.idx")
+                indexes.append(f"{idx_stem}.idx")
+            summary[table.name] = {"kept": kept, "dropped": dropped, "indexes": indexes}
+        publish(staging, target)
+    return summary
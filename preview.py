@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+from datetime import date, timedelta
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from desktop_exporter.api import AjaxAPI
+from desktop_exporter.config import load_config
+from desktop_exporter.local_export import DEFAULT_LAYOUT
+from desktop_exporter.metrics import recent_records
+from desktop_exporter.snapshot import Snapshot
+
+
+# Estimation settings; lines_per_factura is only used while the local snapshot is empty.
+# Override with "PREVIEW" in the config:
+# {"zip_ratio": ..., "lines_per_factura": ..., "chunk_facturas": ..., "chunk_seconds": ...,
+#  "confirm_facturas": ..., "auto_chunk": true}
+DEFAULT_PREVIEW: Dict[str, Any] = {
+    # Compressed ZIP size over raw DBF size; fixed-width text columns compress well
+    "zip_ratio": 0.2,
+    "lines_per_factura": 5.0,
+    # Above either of these the export is split into windows
+    "chunk_facturas": 20_000,
+    "chunk_seconds": 60,
+    # Above this the GUI asks before starting
+    "confirm_facturas": 250_000,
+    "auto_chunk": True,
+}
+# Export kinds whose metrics describe a server-side ZIP download
+_DOWNLOAD_KINDS = ("server", "chunked", "incremental")
+
+
+def _record_lengths(layout: Mapping[str, Any]) -> Tuple[int, int]:
+    # Deletion flag plus the field widths
+    cab = 1 + sum(int(col[2]) for col in layout["movimcab"])
+    ite = 1 + sum(int(col[2]) for col in layout["movimite"])
+    return cab, ite
+
+
+def _missing_spans(missing: List[str], desde: date, hasta: date) -> List[Tuple[date, date]]:
+    spans = []
+    for month in missing:
+        start = date.fromisoformat(f"{month}-01")
+        end = (start.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+        spans.append((max(start, desde), min(end, hasta)))
+    return spans
+
+
+def past_throughput(base_url: str) -> Optional[float]:
+    """Bytes per second of recent ZIP downloads from this server (wall time, so it includes server work)."""
+    received = seconds = 0.0
+    for record in recent_records(_DOWNLOAD_KINDS, base_url=base_url):
+        got = record.get("counters", {}).get("bytes_downloaded", 0)
+        if got and record.get("wall_seconds"):
+            received += got
+            seconds += record["wall_seconds"]
+    return received / seconds if seconds else None
+
+
+def recommend_window(facturas: int, seconds: Optional[float], days: int, settings: Mapping[str, Any]) -> Optional[str]:
+    if facturas < settings["chunk_facturas"] and (seconds is None or seconds < settings["chunk_seconds"]):
+        return None
+    return "week" if days <= 92 else "month"
+
+
+def preview_range(base_url: str, token: str, desde_iso: str, hasta_iso: str, today: date | None = None) -> Dict[str, Any]:
+    """
+    Cheap estimate for an export: invoice/line counts from the local snapshot, asking the
+    API's paginated count only for months that are not available locally; ZIP size from
+    the layout's record widths; duration from past download throughput. Also returns the
+    recommended chunk window (None when a single export is fine).
+    """
+    cfg = load_config()
+    settings = {**DEFAULT_PREVIEW, **(cfg.get("PREVIEW") or {})}
+    layout = cfg.get("DBF_LAYOUT") or DEFAULT_LAYOUT
+    desde, hasta = date.fromisoformat(desde_iso), date.fromisoformat(hasta_iso)
+    if hasta < desde:
+        raise ValueError("La fecha 'Hasta' es anterior a 'Desde'")
+    today = today or date.today()
+
+    local = Snapshot(base_url, lines_key=layout.get("lines_key", "items")).totals(desde, hasta, fields=())
+    facturas, lineas = local["facturas"], local["lineas"]
+    lines_per_factura = lineas / facturas if facturas else settings["lines_per_factura"]
+    sources = ["local"] if len(local["missing"]) < len(Snapshot.months(desde, hasta)) else []
+    exact = True
+
+    spans = [(s, e) for s, e in _missing_spans(local["missing"], desde, hasta) if s <= today]
+    if spans:
+        with AjaxAPI(base_url=base_url, token=token, retries=1) as api:
+            for start, end in spans:
+                count = api.count_facturas(start.isoformat(), end.isoformat())
+                if count is None:
+                    exact = False
+                    continue
+                facturas += count
+                lineas += round(count * lines_per_factura)
+        sources.append("api")
+
+    cab_len, ite_len = _record_lengths(layout)
+    dbf_bytes = facturas * cab_len + lineas * ite_len
+    zip_bytes = int(dbf_bytes * settings["zip_ratio"])
+    throughput = past_throughput(base_url)
+    seconds = zip_bytes / throughput if throughput else None
+    days = (hasta - desde).days + 1
+    return {
+        "desde": desde_iso,
+        "hasta": hasta_iso,
+        "facturas": facturas,
+        "lineas": lineas,
+        # False when some month could not be counted (unpaginated endpoint)
+        "exact": exact,
+        "source": "+".join(sources),
+        "dbf_bytes": dbf_bytes,
+        "zip_bytes": zip_bytes,
+        "seconds": round(seconds, 1) if seconds is not None else None,
+        "window": recommend_window(facturas, seconds, days, settings),
+        "confirm": facturas >= settings["confirm_facturas"],
+        "auto_chunk": bool(settings["auto_chunk"]),
+    }
+
+
+def format_preview(preview: Mapping[str, Any]) -> str:
+    size_mb = preview["zip_bytes"] / (1024 * 1024)
+    approx = "" if preview["exact"] else "≥"
+    facturas, lineas = (f"{n:,}".replace(",", ".") for n in (preview["facturas"], preview["lineas"]))
+    text = f"{approx}{facturas} facturas, ~{lineas} líneas, ZIP ~{size_mb:.1f} MB"
+    if preview["seconds"] is not None:
+        minutes, secs = divmod(int(preview["seconds"]), 60)
+        text += f", ~{minutes} min {secs} s" if minutes else f", ~{secs} s"
+    if preview["window"]:
+        action = "se descargará" if preview["auto_chunk"] else "conviene descargar"
+        label = {"week": "semanas", "month": "meses"}[preview["window"]]
+        text += f" — {action} por {label}"
+    return text
@@ -0,0 +1,505 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import mmap
+import os
+import shutil
+import sys
+import threading
+import time
+from array import array
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+from desktop_exporter.api import AjaxAPI, ProgressCallback
+from desktop_exporter.config import _config_path
+
+
+FORMAT_VERSION = 1
+# Null markers for the fixed-width column kinds; string kinds use code -1
+INT_NULL = -(2 ** 63)
+# Column kinds: array typecode of the .bin file and whether values live in a string table
+KINDS = {"q": "q", "d": "d", "s": "i", "j": "i", "b": "b"}
+DAY_COLUMN = "__dia"
+PARENT_COLUMN = "__cab"
+
+
+def _snapshot_root() -> Path:
+    # Lives next to the config file, like the day cache
+    return _config_path().with_name(".desktop_exporter_snapshot")
+
+
+def _month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _month_end(month: date) -> date:
+    return (month.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+
+
+def _flatten(record: Mapping[str, Any], skip: str = "", prefix: str = "") -> Dict[str, Any]:
+    # Nested objects become dotted keys, the same paths DBF_LAYOUT uses
+    flat: Dict[str, Any] = {}
+    for key, value in record.items():
+        if not prefix and key == skip:
+            continue
+        name = f"{prefix}{key}"
+        if isinstance(value, Mapping):
+            flat.update(_flatten(value, prefix=f"{name}."))
+        else:
+            flat[name] = value
+    return flat
+
+
+def _unflatten(flat: Iterable[Tuple[str, Any]]) -> Dict[str, Any]:
+    record: Dict[str, Any] = {}
+    for name, value in flat:
+        node = record
+        *parents, leaf = name.split(".")
+        for part in parents:
+            node = node.setdefault(part, {})
+        node[leaf] = value
+    return record
+
+
+class _ColumnBuilder:
+    """
+    Values of one flattened key, appended row by row. The kind starts as narrow as the
+    data allows (int64, then float64) and widens to a string table, or to JSON-encoded
+    values when types are mixed, so every value comes back with its original type.
+    """
+
+    def __init__(self, leading_nulls: int) -> None:
+        self.kind: Optional[str] = None
+        self.nulls = leading_nulls
+        self.data: Optional[array] = None
+        self.strings: Dict[str, int] = {}
+
+    @staticmethod
+    def _kind_of(value: Any) -> str:
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            return "j"
+        if isinstance(value, int):
+            return "q" if -(2 ** 63) < value < 2 ** 63 else "j"
+        return "d" if isinstance(value, float) else "s"
+
+    def _encode(self, value: Any) -> Any:
+        if value is None:
+            return INT_NULL if self.kind == "q" else math.nan if self.kind == "d" else -1
+        if self.kind in ("q", "d"):
+            return value
+        text = value if self.kind == "s" else json.dumps(value, ensure_ascii=False)
+        code = self.strings.get(text)
+        if code is None:
+            code = self.strings[text] = len(self.strings)
+        return code
+
+    def _widen(self, kind: str) -> None:
+        old = list(self.values())
+        self.kind, self.strings = kind, {}
+        self.data = array(KINDS[kind], (self._encode(v) for v in old))
+
+    def values(self) -> Iterator[Any]:
+        if self.data is None:
+            yield from (None for _ in range(self.nulls))
+            return
+        table = list(self.strings)
+        for raw in self.data:
+            yield _decode(self.kind, raw, table)
+
+    def append(self, value: Any) -> None:
+        if value is None:
+            if self.data is None:
+                self.nulls += 1
+            else:
+                self.data.append(self._encode(None))
+            return
+        kind = self._kind_of(value)
+        if self.kind is None:
+            self.kind = kind
+            self.data = array(KINDS[kind])
+            self.data.extend(self._encode(None) for _ in range(self.nulls))
+        elif kind != self.kind:
+            if self.kind == "d" and kind == "q":
+                # Already a float column: store the int as a float, no rebuild
+                value = float(value)
+            elif self.kind == "q" and kind == "d":
+                self._widen("d")
+            elif self.kind != "j":
+                self._widen("j")
+        self.data.append(self._encode(value))
+
+    def write(self, base: Path) -> Dict[str, Any]:
+        if self.data is None:
+            # Only nulls: nothing to store, the reader fills them in
+            return {"kind": None}
+        with Path(f"{base}.bin").open("wb") as fh:
+            self.data.tofile(fh)
+        if self.kind in ("s", "j"):
+            with Path(f"{base}.json").open("w", encoding="utf-8") as fh:
+                json.dump(list(self.strings), fh, ensure_ascii=False)
+        return {"kind": self.kind}
+
+
+def _decode(kind: Optional[str], raw: Any, table: Sequence[str]) -> Any:
+    if kind == "b":
+        return raw
+    if kind == "q":
+        return None if raw == INT_NULL else raw
+    if kind == "d":
+        return None if raw != raw else raw
+    if kind == "s":
+        return None if raw < 0 else table[raw]
+    if kind == "j":
+        return None if raw < 0 else json.loads(table[raw])
+    return None
+
+
+class _TableBuilder:
+    def __init__(self) -> None:
+        self.rows = 0
+        self.columns: Dict[str, _ColumnBuilder] = {}
+
+    def append(self, flat: Mapping[str, Any]) -> None:
+        for name in flat:
+            if name not in self.columns:
+                self.columns[name] = _ColumnBuilder(self.rows)
+        for name, column in self.columns.items():
+            column.append(flat.get(name))
+        self.rows += 1
+
+    def write(self, directory: Path, prefix: str) -> List[Dict[str, Any]]:
+        described = []
+        for i, (name, column) in enumerate(self.columns.items()):
+            described.append({"name": name, **column.write(directory / f"{prefix}.{i}")})
+        return described
+
+
+class SnapshotPartition:
+    """
+    One month of facturas as columns of fixed-width arrays, memory-mapped on read.
+    Header rows ("cab") and lines ("ite") are separate tables; each line carries the
+    index of its header row, and lines are stored in header order.
+    """
+
+    def __init__(self, directory: Path, meta: Dict[str, Any]) -> None:
+        self.directory = directory
+        self.meta = meta
+        self._maps: List[mmap.mmap] = []
+        self._views: Dict[Tuple[str, str], Any] = {}
+        self._tables: Dict[Tuple[str, str], List[str]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def rows(self) -> int:
+        return self.meta["rows"]
+
+    @property
+    def lines(self) -> int:
+        return self.meta["lines"]
+
+    def _describe(self, table: str, name: str) -> Tuple[int, Dict[str, Any]]:
+        for i, column in enumerate(self.meta["columns"][table]):
+            if column["name"] == name:
+                return i, column
+        raise KeyError(name)
+
+    def column_names(self, table: str = "cab") -> List[str]:
+        return [c["name"] for c in self.meta["columns"][table]]
+
+    def raw(self, table: str, name: str) -> Any:
+        """The stored codes/values of a column as a read-only memoryview (or a list of nulls)."""
+        with self._lock:
+            cached = self._views.get((table, name))
+            if cached is not None:
+                return cached
+            i, column = self._describe(table, name)
+            count = self.rows if table == "cab" else self.lines
+            if column["kind"] is None or count == 0:
+                view: Any = [None] * count
+            else:
+                with (self.directory / f"{table}.{i}.bin").open("rb") as fh:
+                    mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps.append(mm)
+                view = memoryview(mm).cast(KINDS[column["kind"]])
+            self._views[(table, name)] = view
+            return view
+
+    def strings(self, table: str, name: str) -> List[str]:
+        with self._lock:
+            cached = self._tables.get((table, name))
+            if cached is None:
+                i, column = self._describe(table, name)
+                cached = []
+                if column["kind"] in ("s", "j"):
+                    with (self.directory / f"{table}.{i}.json").open("r", encoding="utf-8") as fh:
+                        cached = json.load(fh)
+                self._tables[(table, name)] = cached
+            return cached
+
+    def values(self, table: str, name: str) -> Iterator[Any]:
+        _i, column = self._describe(table, name)
+        view, strings = self.raw(table, name), self.strings(table, name)
+        for raw in view:
+            yield _decode(column["kind"], raw, strings)
+
+    def row_range(self, first_day: int, last_day: int) -> List[int]:
+        """Header rows whose day of month is within [first_day, last_day]."""
+        days = self.raw("cab", DAY_COLUMN)
+        if first_day <= 1 and last_day >= 31:
+            return list(range(self.rows))
+        return [i for i, day in enumerate(days) if first_day <= day <= last_day]
+
+    def sum(self, name: str, rows: Sequence[int] | None = None) -> float:
+        """Sum of a numeric header column, straight off the mapped array."""
+        try:
+            _i, column = self._describe("cab", name)
+        except KeyError:
+            return 0.0
+        if column["kind"] not in ("q", "d"):
+            return 0.0
+        view = self.raw("cab", name)
+        null = INT_NULL if column["kind"] == "q" else None
+        picked = view if rows is None else (view[i] for i in rows)
+        return float(sum(v for v in picked if v != null and v == v))
+
+    def iter_facturas(self, rows: Sequence[int] | None = None, lines_key: str = "items") -> Iterator[Dict[str, Any]]:
+        """Rebuild the original factura dicts (nulls omitted) for the given header rows."""
+        cab_names = [n for n in self.column_names("cab") if n != DAY_COLUMN]
+        ite_names = [n for n in self.column_names("ite") if n != PARENT_COLUMN]
+        cab_cols = [(n, self._describe("cab", n)[1]["kind"], self.raw("cab", n), self.strings("cab", n)) for n in cab_names]
+        ite_cols = [(n, self._describe("ite", n)[1]["kind"], self.raw("ite", n), self.strings("ite", n)) for n in ite_names]
+        parents = self.raw("ite", PARENT_COLUMN) if self.lines else []
+        wanted = range(self.rows) if rows is None else rows
+        line = 0
+        for row in wanted:
+            # Lines are in header order, so one forward cursor serves every row
+            while line < self.lines and parents[line] < row:
+                line += 1
+            items = []
+            while line < self.lines and parents[line] == row:
+                items.append(_unflatten(
+                    (name, value) for name, kind, view, table in ite_cols
+                    if (value := _decode(kind, view[line], table)) is not None
+                ))
+                line += 1
+            factura = _unflatten(
+                (name, value) for name, kind, view, table in cab_cols
+                if (value := _decode(kind, view[row], table)) is not None
+            )
+            factura[lines_key] = items
+            yield factura
+
+    def close(self) -> None:
+        with self._lock:
+            for view in self._views.values():
+                if isinstance(view, memoryview):
+                    view.release()
+            self._views.clear()
+            for mm in self._maps:
+                mm.close()
+            self._maps.clear()
+
+    def __enter__(self) -> "SnapshotPartition":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+class Snapshot:
+    """
+    Local copy of the facturas endpoint, one partition per calendar month, keyed by base
+    URL like DayCache. A month is final once it was fetched `mutable_days` after it ended;
+    until then refresh() pulls it again. Each write goes to a new version directory and is
+    published by replacing current.json, so open readers keep their files.
+    """
+
+    CURRENT = "current.json"
+    _write_locks: Dict[str, threading.Lock] = {}
+    _locks_guard = threading.Lock()
+
+    def __init__(
+        self,
+        base_url: str,
+        root: Path | None = None,
+        mutable_days: int = 1,
+        lines_key: str = "items",
+        date_key: str = "fecha",
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        key = hashlib.sha1(self.base_url.encode("utf-8")).hexdigest()[:16]
+        self.root = (root or _snapshot_root()) / key
+        self.mutable_days = max(1, mutable_days)
+        self.lines_key = lines_key
+        self.date_key = date_key
+
+    def month_dir(self, month: date) -> Path:
+        return self.root / month.strftime("%Y-%m")
+
+    def _lock_for(self, month: date) -> threading.Lock:
+        name = str(self.month_dir(month))
+        with self._locks_guard:
+            return self._write_locks.setdefault(name, threading.Lock())
+
+    @staticmethod
+    def months(desde: date, hasta: date) -> List[date]:
+        months: List[date] = []
+        month = _month_start(desde)
+        while month <= hasta:
+            months.append(month)
+            month = _month_end(month) + timedelta(days=1)
+        return months
+
+    def meta(self, month: date) -> Optional[Dict[str, Any]]:
+        directory = self.month_dir(month)
+        try:
+            with (directory / self.CURRENT).open("r", encoding="utf-8") as fh:
+                version = json.load(fh)["version"]
+            with (directory / version / "meta.json").open("r", encoding="utf-8") as fh:
+                meta = json.load(fh)
+        except Exception:
+            # Missing or corrupt; treat as never fetched
+            return None
+        if meta.get("format") != FORMAT_VERSION or meta.get("byteorder") != sys.byteorder:
+            return None
+        meta["version"] = version
+        return meta
+
+    def is_final(self, month: date, meta: Dict[str, Any] | None = None) -> bool:
+        meta = meta if meta is not None else self.meta(month)
+        if meta is None:
+            return False
+        fetched_on = date.fromisoformat(meta["fetched_on"])
+        return fetched_on >= _month_end(month) + timedelta(days=self.mutable_days)
+
+    def stale_months(self, desde: date, hasta: date, today: date | None = None) -> List[date]:
+        """Months of the range that are missing or still open; future months are skipped."""
+        today = today or date.today()
+        return [m for m in self.months(desde, hasta) if m <= today and not self.is_final(m)]
+
+    def store_month(self, month: date, facturas: Iterable[Mapping[str, Any]], fetched_on: date | None = None) -> Dict[str, Any]:
+        """Write a complete month as a new version and make it current."""
+        with self._lock_for(month):
+            directory = self.month_dir(month)
+            directory.mkdir(parents=True, exist_ok=True)
+            version = f"v{time.time_ns()}"
+            staging = directory / f".{version}.tmp"
+            staging.mkdir()
+            try:
+                cab, ite = _TableBuilder(), _TableBuilder()
+                days = array("b")
+                for factura in facturas:
+                    for line in factura.get(self.lines_key) or ():
+                        ite.append({**_flatten(line), PARENT_COLUMN: cab.rows})
+                    days.append(self._day_of(factura, month))
+                    cab.append(_flatten(factura, skip=self.lines_key))
+                cab.columns[DAY_COLUMN] = _ColumnBuilder(0)
+                cab.columns[DAY_COLUMN].kind, cab.columns[DAY_COLUMN].data = "b", days
+                if PARENT_COLUMN not in ite.columns:
+                    ite.columns[PARENT_COLUMN] = _ColumnBuilder(0)
+                meta = {
+                    "format": FORMAT_VERSION,
+                    "byteorder": sys.byteorder,
+                    "month": month.strftime("%Y-%m"),
+                    "fetched_on": (fetched_on or date.today()).isoformat(),
+                    "fetched_at": datetime.now().isoformat(timespec="seconds"),
+                    "rows": cab.rows,
+                    "lines": ite.rows,
+                    "columns": {"cab": cab.write(staging, "cab"), "ite": ite.write(staging, "ite")},
+                }
+                with (staging / "meta.json").open("w", encoding="utf-8") as fh:
+                    json.dump(meta, fh)
+                os.replace(staging, directory / version)
+            except BaseException:
+                shutil.rmtree(staging, ignore_errors=True)
+                raise
+            pointer = directory / f".{version}.current"
+            with pointer.open("w", encoding="utf-8") as fh:
+                json.dump({"version": version}, fh)
+            os.replace(pointer, directory / self.CURRENT)
+            # Older versions may still be mapped by a reader (and locked on Windows); best effort
+            for old in directory.iterdir():
+                if old.is_dir() and old.name != version and not old.name.startswith("."):
+                    shutil.rmtree(old, ignore_errors=True)
+            meta["version"] = version
+            return meta
+
+    def _day_of(self, factura: Mapping[str, Any], month: date) -> int:
+        value = factura.get(self.date_key)
+        try:
+            day = date.fromisoformat(str(value)[:10])
+        except ValueError:
+            return 0
+        return day.day if _month_start(day) == month else 0
+
+    def refresh(
+        self,
+        api: AjaxAPI,
+        desde: date,
+        hasta: date,
+        today: date | None = None,
+        on_progress: ProgressCallback | None = None,
+    ) -> List[date]:
+        """Re-pull every stale month of the range in full. Returns the months fetched."""
+        today = today or date.today()
+        stale = self.stale_months(desde, hasta, today)
+        for n, month in enumerate(stale):
+            end = min(_month_end(month), today)
+            facturas = api.iter_facturas(fecha_desde=month.isoformat(), fecha_hasta=end.isoformat())
+            self.store_month(month, facturas, fetched_on=today)
+            if on_progress is not None:
+                on_progress(n + 1, len(stale))
+        return stale
+
+    def open(self, month: date) -> Optional[SnapshotPartition]:
+        meta = self.meta(month)
+        if meta is None:
+            return None
+        return SnapshotPartition(self.month_dir(month) / meta["version"], meta)
+
+    def _partitions(self, desde: date, hasta: date) -> Iterator[Tuple[date, Optional[SnapshotPartition], List[int]]]:
+        for month in self.months(desde, hasta):
+            partition = self.open(month)
+            if partition is None:
+                yield month, None, []
+                continue
+            first = desde.day if _month_start(desde) == month else 1
+            last = hasta.day if _month_start(hasta) == month else 31
+            with partition:
+                yield month, partition, partition.row_range(first, last)
+
+    def iter_facturas(self, desde: date, hasta: date, today: date | None = None) -> Iterator[Dict[str, Any]]:
+        """Facturas of the range from local data only; fails if a needed month was never fetched."""
+        today = today or date.today()
+        for month, partition, rows in self._partitions(desde, hasta):
+            if partition is None:
+                if month > today:
+                    continue
+                raise ValueError(f"No hay datos locales para {month.strftime('%Y-%m')}; actualice la copia local con conexión")
+            yield from partition.iter_facturas(rows, self.lines_key)
+
+    def totals(self, desde: date, hasta: date, fields: Sequence[str] = ("total", "iva_5", "iva_10")) -> Dict[str, Any]:
+        """Invoice/line counts and column sums for the range, plus the months not available locally."""
+        result: Dict[str, Any] = {"facturas": 0, "lineas": 0, "missing": []}
+        sums = {name: 0.0 for name in fields}
+        for month, partition, rows in self._partitions(desde, hasta):
+            if partition is None:
+                result["missing"].append(month.strftime("%Y-%m"))
+                continue
+            result["facturas"] += len(rows)
+            if len(rows) == partition.rows:
+                result["lineas"] += partition.lines
+                for name in fields:
+                    sums[name] += partition.sum(name)
+            else:
+                wanted = set(rows)
+                parents = partition.raw("ite", PARENT_COLUMN) if partition.lines else []
+                result["lineas"] += sum(1 for p in parents if p in wanted)
+                for name in fields:
+                    sums[name] += partition.sum(name, rows)
+        result.update({name: round(value, 2) for name, value in sums.items()})
+        return result
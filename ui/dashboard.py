@@ -1,12 +1,24 @@
 from __future__ import annotations
 
 import os
+import queue
 import tkinter as tk
 import ttkbootstrap as tb
-from ttkbootstrap.constants import INFO, SUCCESS
+from ttkbootstrap.constants import INFO, SUCCESS, DANGER
 from ttkbootstrap.widgets import DateEntry
 
-from desktop_exporter.actions import export_via_gui
+from desktop_exporter.actions import format_profiles_summary
+from desktop_exporter.config import load_profiles
+from desktop_exporter.credentials import find_tokens
+from desktop_exporter.job_queue import ExportScheduler, cached_token
+from desktop_exporter.jobs import JobRunner
+from desktop_exporter.preview import format_preview, preview_range
+
+# Wait for the dates to settle before asking for a preview
+PREVIEW_DELAY_MS = 400
+# How often scheduler events are handed over to the Tk thread
+QUEUE_POLL_MS = 100
+STATUS_LABELS = {"pending": "En cola", "running": "En curso", "done": "Terminado", "error": "Error", "cancelled": "Cancelado"}
 
 
 class Dashboard(tb.Frame):
@@ -17,6 +29,24 @@ class Dashboard(tb.Frame):
         self.target_var = target_var
         self.on_pick_dir = on_pick_dir
 
+        # Exports go through the persistent queue (one at a time unless QUEUE_WORKERS says
+        # otherwise); the same scheduler runs saved daily schedules while the app is open
+        self._queue_events = queue.Queue()
+        self._tokens = {}
+        # Account behind the login-form token, per base URL
+        self._accounts = {}
+        # Jobs queued from this window: job id -> profile name (None for a plain export)
+        self._mine = {}
+        self._profile_results = []
+        self.scheduler = ExportScheduler(listener=self._queue_events.put, token_for=self._token_for).start()
+        self.after(QUEUE_POLL_MS, self._drain_queue_events)
+        self.var_status = tk.StringVar(value="")
+        # Range previews run on their own worker so they never wait behind an export
+        self.previews = JobRunner(self, max_workers=1)
+        self.var_preview = tk.StringVar(value="")
+        self._preview = None
+        self._preview_after = None
+
         self.columnconfigure(0, weight=1)
 
         inner = tb.Frame(self)
@@ -40,7 +70,12 @@ class Dashboard(tb.Frame):
         self.hasta_picker.entry.bind('<Key>', lambda e: 'break')
         self.hasta_picker.entry.bind('<Control-Key>', lambda e: 'break')
 
-        rowi += 2
+        for picker in (self.desde_picker, self.hasta_picker):
+            picker.bind('<<DateEntrySelected>>', self._schedule_preview)
+
+        rowi += 1
+        tb.Label(inner, textvariable=self.var_preview, bootstyle=INFO).grid(row=rowi, column=0, sticky=tk.W, padx=24)
+        rowi += 1
 
         if os.name != "nt":
             rowi += 1
@@ -55,17 +90,289 @@ class Dashboard(tb.Frame):
         rowi += 1
         btn_row = tb.Frame(inner)
         btn_row.grid(row=rowi, column=0, sticky="n", pady=(16, 0))
-        tb.Button(btn_row, text="Exportar", bootstyle=SUCCESS, command=self._do_export).pack()
+        tb.Button(btn_row, text="Exportar", bootstyle=SUCCESS, command=self._do_export).pack(side=tk.LEFT)
+        tb.Button(btn_row, text="Perfiles...", bootstyle=INFO, command=self._open_profiles).pack(side=tk.LEFT, padx=(8, 0))
+        tb.Button(btn_row, text="Cola...", bootstyle=INFO, command=self._open_queue).pack(side=tk.LEFT, padx=(8, 0))
+        tb.Button(btn_row, text="Cancelar", bootstyle=DANGER, command=self._cancel).pack(side=tk.LEFT, padx=(8, 0))
+
+        rowi += 1
+        tb.Label(inner, textvariable=self.var_status).grid(row=rowi, column=0, sticky="n", pady=(8, 0))
+        self._schedule_preview()
 
     def _do_export(self):
-        base = self.base_var.get().strip()
-        token = self.token_var.get().strip()
-        desde = self.desde_picker.entry.get().strip()
-        hasta = self.hasta_picker.entry.get().strip()
+        from tkinter import messagebox
+        base = self.base_var.get().strip().rstrip("/")
         target = self.target_var.get().strip()
-        msg = export_via_gui(base, token, desde, hasta, target)
+        try:
+            desde, hasta = self._ui_range_iso()
+        except ValueError:
+            messagebox.showerror("Error", "Fechas inválidas")
+            return
+        options = {}
+        preview = self._current_preview()
+        if preview is not None:
+            if preview["confirm"] and not messagebox.askyesno("Rango grande", f"{format_preview(preview)}\n\n¿Exportar de todos modos?"):
+                return
+            if preview["auto_chunk"] and preview["window"]:
+                options["window"] = preview["window"]
+        token = self.token_var.get().strip()
+        self._tokens[base] = token
+        # The form token stops matching once it is refreshed, so remember whose it is now
+        session = find_tokens(base, token) if token else None
+        if session and session.get("email"):
+            self._accounts[base] = session["email"]
+        try:
+            job_id, created = self.scheduler.enqueue(desde, hasta, target, base_url=base, options=options)
+        except ValueError as exc:
+            messagebox.showerror("Error", str(exc))
+            return
+        self._mine[job_id] = None
+        self._update_status(f"En cola: {desde} → {hasta}" if created else f"Ya estaba en cola: {desde} → {hasta}")
+
+    def _token_for(self, base_url, email=None):
+        # Called from scheduler threads; only reads the dict filled on the Tk thread.
+        # The cached session comes first: it is the one kept refreshed, while the token
+        # from the login form goes stale once the access token is rotated. A profile's
+        # account never falls back to whoever logged in through the form.
+        base = base_url.rstrip("/")
+        if email:
+            return cached_token(base, email)
+        account = self._accounts.get(base)
+        return (account and cached_token(base, account)) or self._tokens.get(base, "")
+
+    def _schedule_preview(self, event=None):
+        if self._preview_after is not None:
+            self.after_cancel(self._preview_after)
+        self._preview_after = self.after(PREVIEW_DELAY_MS, self._run_preview)
+
+    def _run_preview(self):
+        self._preview_after = None
+        self._preview = None
+        try:
+            desde, hasta = self._ui_range_iso()
+        except ValueError:
+            self.var_preview.set("")
+            return
+        if hasta < desde:
+            self.var_preview.set("La fecha 'Hasta' es anterior a 'Desde'")
+            return
+        base = self.base_var.get().strip()
+        if not base:
+            self.var_preview.set("")
+            return
+        # A running preview for the old dates is left to finish; its result is ignored
+        self.previews.cancel_all()
+        self.previews.submit(preview_range, base, self._token_for(base), desde, hasta, listener=self._on_preview_event)
+        self.var_preview.set("Calculando estimación...")
+
+    def _current_preview(self):
+        try:
+            desde, hasta = self._ui_range_iso()
+        except ValueError:
+            return None
+        preview = self._preview
+        if preview is None or (preview["desde"], preview["hasta"]) != (desde, hasta):
+            return None
+        return preview
+
+    def _on_preview_event(self, event):
+        if event.kind == "done":
+            self._preview = event.payload
+            if self._current_preview() is not None:
+                self.var_preview.set(format_preview(self._preview))
+        elif event.kind == "error":
+            self.var_preview.set("Sin estimación para el rango")
+
+    def _ui_range_iso(self):
+        from datetime import datetime
+        desde = datetime.strptime(self.desde_picker.entry.get().strip(), "%m-%d-%Y").strftime("%Y-%m-%d")
+        hasta = datetime.strptime(self.hasta_picker.entry.get().strip(), "%m-%d-%Y").strftime("%Y-%m-%d")
+        return desde, hasta
+
+    def _open_profiles(self):
         from tkinter import messagebox
-        messagebox.showinfo("OK", msg)
+        profiles = sorted(load_profiles())
+        if not profiles:
+            messagebox.showinfo("Perfiles", "No hay perfiles guardados. Créelos en Ajustes (F1).")
+            return
+        dlg = tb.Toplevel(self)
+        dlg.title("Exportar perfiles")
+        dlg.resizable(False, False)
+        frm = tb.Frame(dlg, padding=16)
+        frm.pack(fill=tk.BOTH, expand=True)
+        tb.Label(frm, text="Perfiles a exportar con el rango seleccionado").pack(anchor=tk.W, pady=(0, 8))
+        listbox = tk.Listbox(frm, selectmode=tk.MULTIPLE, height=min(10, len(profiles)), exportselection=False)
+        for name in profiles:
+            listbox.insert(tk.END, name)
+        listbox.select_set(0, tk.END)
+        listbox.pack(fill=tk.BOTH, expand=True)
+
+        def on_export():
+            names = [profiles[i] for i in listbox.curselection()]
+            dlg.destroy()
+            if names:
+                self._do_profiles_export(names)
 
+        tb.Button(frm, text="Exportar", bootstyle=SUCCESS, command=on_export).pack(anchor=tk.E, pady=(12, 0))
 
+    def _cancel(self):
+        # Only jobs queued from this window, pending or running; scheduled runs and jobs
+        # queued by the CLI share the scheduler and must not be lost
+        for job_id in list(self._mine):
+            self.scheduler.cancel(job_id)
 
+    def _do_profiles_export(self, names):
+        desde, hasta = self._ui_range_iso()
+        for name in names:
+            job_id, _created = self.scheduler.enqueue(desde, hasta, profile=name)
+            self._mine[job_id] = name
+        self._update_status(f"En cola: {len(names)} perfiles, {desde} → {hasta}")
+
+    def _drain_queue_events(self):
+        try:
+            while True:
+                self._on_job_event(self._queue_events.get_nowait())
+        except queue.Empty:
+            pass
+        self.after(QUEUE_POLL_MS, self._drain_queue_events)
+
+    def destroy(self):
+        # Running exports stop at their next progress tick and stay queued for the next start
+        self.scheduler.stop(timeout=1.0)
+        super().destroy()
+
+    def _open_queue(self):
+        from tkinter import messagebox
+        store = self.scheduler.store
+        dlg = tb.Toplevel(self)
+        dlg.title("Cola de exportaciones")
+        frm = tb.Frame(dlg, padding=16)
+        frm.pack(fill=tk.BOTH, expand=True)
+
+        columns = ("id", "rango", "destino", "estado", "detalle")
+        tree = tb.Treeview(frm, columns=columns, show="headings", height=10)
+        for col, width in zip(columns, (50, 180, 200, 90, 320)):
+            tree.heading(col, text=col.capitalize())
+            tree.column(col, width=width, anchor=tk.W)
+        tree.pack(fill=tk.BOTH, expand=True)
+
+        def refresh():
+            if not dlg.winfo_exists():
+                return
+            tree.delete(*tree.get_children())
+            for job in store.list_jobs(50):
+                where = f"Perfil {job['profile']}" if job["profile"] else job["target"]
+                detail = job["error"] or job["message"] or ""
+                tree.insert("", tk.END, iid=str(job["id"]), values=(
+                    job["id"], f"{job['desde']} → {job['hasta']}", where, STATUS_LABELS.get(job["status"], job["status"]), detail))
+            dlg.after(2000, refresh)
+
+        def on_cancel():
+            for iid in tree.selection():
+                self.scheduler.cancel(int(iid))
+
+        tb.Button(frm, text="Cancelar seleccionados", bootstyle=DANGER, command=on_cancel).pack(anchor=tk.E, pady=(8, 12))
+
+        # Daily schedules: queue the chosen range at a fixed time, for the current destination or a profile
+        tb.Label(frm, text="Programación diaria").pack(anchor=tk.W)
+        sched_list = tk.Listbox(frm, height=4, exportselection=False)
+        sched_list.pack(fill=tk.X, pady=(4, 4))
+
+        def refresh_schedules():
+            sched_list.delete(0, tk.END)
+            for sched in store.list_schedules():
+                where = f"perfil {sched['profile']}" if sched["profile"] else sched["target"]
+                sched_list.insert(tk.END, f"{sched['name']}: {sched['at']} {sched['desde']} → {sched['hasta']} ({where}), próxima {sched['next_run']}")
+
+        form = tb.Frame(frm)
+        form.pack(fill=tk.X)
+        name_var, at_var = tk.StringVar(value="diaria"), tk.StringVar(value="02:00")
+        ranges = {"Ayer": ("yesterday", "yesterday"), "Hoy": ("today", "today"), "Últimos 7 días": ("today-7", "yesterday"), "Mes anterior": ("last_month_start", "last_month_end")}
+        range_box = tb.Combobox(form, values=list(ranges), width=16, state="readonly")
+        range_box.set("Ayer")
+        profile_box = tb.Combobox(form, values=[""] + sorted(load_profiles()), width=16, state="readonly")
+        tb.Entry(form, textvariable=name_var, width=12).pack(side=tk.LEFT)
+        tb.Entry(form, textvariable=at_var, width=6).pack(side=tk.LEFT, padx=(8, 0))
+        range_box.pack(side=tk.LEFT, padx=(8, 0))
+        profile_box.pack(side=tk.LEFT, padx=(8, 0))
+
+        def on_add():
+            desde, hasta = ranges[range_box.get()]
+            profile = profile_box.get() or None
+            try:
+                store.add_schedule(
+                    name_var.get().strip(), at_var.get().strip(), desde, hasta,
+                    target="" if profile else self.target_var.get().strip(),
+                    profile=profile, base_url=None if profile else self.base_var.get().strip().rstrip("/"),
+                )
+            except ValueError as exc:
+                messagebox.showerror("Error", str(exc), parent=dlg)
+                return
+            refresh_schedules()
+            self.scheduler.wake()
+
+        def on_delete():
+            names = [store.list_schedules()[i]["name"] for i in sched_list.curselection()]
+            for name in names:
+                store.delete_schedule(name)
+            refresh_schedules()
+
+        tb.Button(form, text="Programar", bootstyle=SUCCESS, command=on_add).pack(side=tk.LEFT, padx=(8, 0))
+        tb.Button(form, text="Eliminar", bootstyle=DANGER, command=on_delete).pack(side=tk.LEFT, padx=(8, 0))
+        refresh()
+        refresh_schedules()
+
+    def _update_status(self, text):
+        pending = len(self.scheduler.active)
+        suffix = f" ({pending} en curso)" if pending > 1 else ""
+        self.var_status.set(text + suffix)
+
+    def _on_job_event(self, event):
+        from tkinter import messagebox
+        if event.kind == "progress":
+            received, total = event.payload
+            mb = received / (1024 * 1024)
+            if total:
+                self._update_status(f"Descargando... {mb:.1f} MB ({received * 100 // total}%)")
+            else:
+                self._update_status(f"Descargando... {mb:.1f} MB")
+            return
+        if event.job.id not in self._mine:
+            # Scheduled, or queued by another instance: the status line is enough
+            self._update_status(f"Trabajo {event.job.id}: {STATUS_LABELS.get(event.kind, event.kind)}")
+            return
+        profile = self._mine.pop(event.job.id)
+        if profile is not None:
+            self._on_profile_job_event(event, profile)
+        elif event.kind == "done":
+            self._update_status("")
+            messagebox.showinfo("OK", event.payload)
+        elif event.kind == "cancelled":
+            self._update_status("Exportación cancelada")
+        elif event.kind == "error":
+            self._update_status("")
+            try:
+                self.clipboard_clear()
+                self.clipboard_append(str(event.payload))
+            except Exception:
+                pass
+            messagebox.showerror("Error", str(event.payload))
+
+    def _on_profile_job_event(self, event, profile):
+        from datetime import datetime
+        from tkinter import messagebox
+        job = self.scheduler.store.get(event.job.id) or {}
+        seconds = 0.0
+        if job.get("started_at") and job.get("finished_at"):
+            seconds = (datetime.fromisoformat(job["finished_at"]) - datetime.fromisoformat(job["started_at"])).total_seconds()
+        status = "ok" if event.kind == "done" else event.kind
+        self._profile_results.append({"profile": profile, "status": status, "message": event.payload, "error": event.payload or status, "seconds": seconds})
+        if any(name is not None for name in self._mine.values()):
+            self._update_status(f"Perfil {profile}: {STATUS_LABELS.get(event.kind, event.kind)}")
+            return
+        # Last profile of the batch: one summary, like a single multi-profile export
+        results, self._profile_results = self._profile_results, []
+        self._update_status("")
+        ok = all(r["status"] == "ok" for r in results)
+        show = messagebox.showinfo if ok else messagebox.showwarning
+        show("Perfiles", format_profiles_summary({"ok": ok, "profiles": results}))
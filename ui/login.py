@@ -5,6 +5,7 @@ import ttkbootstrap as tb
 from ttkbootstrap.constants import PRIMARY, DANGER
 
 from desktop_exporter.api import AjaxAPI
+from desktop_exporter.jobs import JobRunner
 
 
 class LoginDialog(tb.Toplevel):
@@ -18,6 +19,7 @@ class LoginDialog(tb.Toplevel):
         self.base_url_var = base_url_var
         self.token_out = token_out
         self.user_email_out = user_email_out
+        self.jobs = JobRunner(self, max_workers=1)
 
         frm = tb.Frame(self, padding=10)
         frm.pack(fill=tk.BOTH, expand=True)
@@ -31,13 +33,17 @@ class LoginDialog(tb.Toplevel):
         tb.Button(btns, text="Entrar", bootstyle=PRIMARY, command=self.on_login).pack(side=tk.RIGHT)
 
     def on_login(self) -> None:
-        try:
-            api = AjaxAPI(base_url=self.base_url_var.get())
-            access = api.login(self.var_email.get().strip(), self.var_password.get().strip())
-            self.token_out.set(access)
-            self.user_email_out.set(self.var_email.get().strip())
+        email = self.var_email.get().strip()
+        api = AjaxAPI(base_url=self.base_url_var.get())
+        self.jobs.submit(api.login, email, self.var_password.get().strip(), listener=lambda event: self._on_login_event(event, email))
+
+    def _on_login_event(self, event, email: str) -> None:
+        if event.kind == "done":
+            self.token_out.set(event.payload)
+            self.user_email_out.set(email)
             self.destroy()
-        except Exception as exc:
+        elif event.kind == "error":
+            exc = event.payload
             try:
                 self.clipboard_clear()
                 self.clipboard_append(str(exc))
@@ -46,6 +52,3 @@ class LoginDialog(tb.Toplevel):
                 pass
             from tkinter import messagebox
             messagebox.showerror("Login", str(exc))
-
-
-
@@ -1,10 +1,10 @@
 from __future__ import annotations
 
 import ttkbootstrap as tb
-from desktop_exporter.config import load_config, save_config
+from desktop_exporter.config import load_config, save_config, load_profiles, save_profile, delete_profile
 
 
-def open_settings(parent, base_var):
+def open_settings(parent, base_var, target_var=None, email_var=None, on_profile=None):
     dlg = tb.Toplevel(parent)
     dlg.title("Ajustes")
     dlg.resizable(False, False)
@@ -12,8 +12,45 @@ def open_settings(parent, base_var):
     frm.pack(fill="both", expand=True)
     tb.Label(frm, text="API Base URL").grid(row=0, column=0, sticky="w", padx=(0, 8), pady=6)
     tb.Entry(frm, textvariable=base_var, width=50).grid(row=0, column=1, sticky="ew", padx=6, pady=6)
+
+    # Named profiles: pick one to load its URL/destination, or type a new name to save the current ones
+    tb.Label(frm, text="Perfil").grid(row=1, column=0, sticky="w", padx=(0, 8), pady=6)
+    profile_row = tb.Frame(frm)
+    profile_row.grid(row=1, column=1, sticky="ew", padx=6, pady=6)
+    profile_row.columnconfigure(0, weight=1)
+    profile_box = tb.Combobox(profile_row, values=sorted(load_profiles()), width=30)
+    profile_box.grid(row=0, column=0, sticky="ew")
+
+    def on_pick_profile(event=None):
+        profile = load_profiles().get(profile_box.get())
+        if not profile:
+            return
+        base_var.set(profile["base_url"])
+        if target_var is not None and profile.get("target"):
+            target_var.set(profile["target"])
+        if on_profile is not None:
+            on_profile(profile)
+
+    def on_save_profile():
+        name = profile_box.get().strip()
+        if not name:
+            return
+        target = target_var.get() if target_var is not None else ""
+        email = email_var.get() if email_var is not None else ""
+        save_profile(name, base_var.get(), target, email)
+        profile_box.configure(values=sorted(load_profiles()))
+
+    def on_delete_profile():
+        delete_profile(profile_box.get().strip())
+        profile_box.set("")
+        profile_box.configure(values=sorted(load_profiles()))
+
+    profile_box.bind("<<ComboboxSelected>>", on_pick_profile)
+    tb.Button(profile_row, text="Guardar perfil", bootstyle="info", command=on_save_profile).grid(row=0, column=1, padx=(8, 0))
+    tb.Button(profile_row, text="Eliminar", bootstyle="danger", command=on_delete_profile).grid(row=0, column=2, padx=(8, 0))
+
     btns = tb.Frame(frm, padding=(0, 8, 0, 0))
-    btns.grid(row=1, column=1, sticky="e")
+    btns.grid(row=2, column=1, sticky="e")
     def on_close():
         cfg = load_config()
         cfg["AJAX_API_BASE"] = base_var.get().strip()
@@ -23,6 +60,3 @@ def open_settings(parent, base_var):
     tb.Button(btns, text="Guardar", bootstyle="primary", command=on_close).pack(side="right")
     dlg.protocol("WM_DELETE_WINDOW", on_close)
     frm.columnconfigure(1, weight=1)
-
-
-